@@ -0,0 +1,162 @@
+"""Flag days with unusually high usage for a user.
+
+Each user has an exponentially weighted mean and variance (EWMA) of kWh and
+of each appliance's usage, over their entries in date order. An entry is
+flagged for a metric when it is above the mean *before* it by more than
+Z_THRESHOLD standard deviations and by at least MIN_EXCESS, once the user
+has MIN_HISTORY earlier entries.
+
+The history is backfilled with one groupby-ewm pass over all users. After
+that, each appended entry updates its user's state in O(metrics). An entry
+dated before the user's last one can't be streamed in order, and an EWMA
+can't take back a replaced or deleted entry, so those users are backfilled
+again from their full history.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, USAGE_COLUMNS
+from utils import get_view, register_view
+
+METRICS = ["kwh"] + USAGE_COLUMNS
+SPAN = 14                # entries; alpha = 2 / (SPAN + 1)
+ALPHA = 2 / (SPAN + 1)
+Z_THRESHOLD = 3.0
+MIN_HISTORY = 7          # earlier entries needed before a user's days are judged
+# Smallest excess over the mean that is worth an alert, by the metric's unit
+# ("kwh", or an appliance's unit), and per-metric overrides of it
+MIN_EXCESS_BY_UNIT = {"kwh": 2.0, "hours": 2.0, "cycles": 2.0}
+MIN_EXCESS = {"ac_hours": 1.0}
+STREAM_MAX_ROWS = 1_000  # larger batches (e.g. imports) are backfilled instead
+
+LABELS = {"kwh": ("Energy", "kWh"),
+          **{a.column: (a.label, "h" if a.unit == "hours" else "cycles") for a in APPLIANCES}}
+ALERT_COLUMNS = ["user_id", "date", "metric", "value", "expected", "z"]
+
+UserState = namedtuple("UserState", ["mean", "var", "count", "last_date"])
+
+_UNITS = {"kwh": "kwh", **{a.column: a.unit for a in APPLIANCES}}
+_MIN_EXCESS = np.array([MIN_EXCESS.get(m, MIN_EXCESS_BY_UNIT[_UNITS[m]]) for m in METRICS])
+
+
+def _values(df):
+    return df[METRICS].astype("float64").fillna(0.0).to_numpy()
+
+
+def _flags(values, mean, var, count):
+    """(rows × metrics) flags and z-scores of ``values`` against the prior state."""
+    excess = values - mean
+    sd = np.sqrt(var)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(sd > 0, excess / sd, np.inf)
+    flagged = (np.asarray(count)[..., None] >= MIN_HISTORY) & (excess > np.maximum(Z_THRESHOLD * sd, _MIN_EXCESS))
+    return flagged, z
+
+
+def _alerts(users, dates, values, mean, flagged, z):
+    rows, cols = np.nonzero(flagged)
+    return pd.DataFrame({
+        "user_id": np.asarray(users)[rows],
+        "date": np.asarray(dates)[rows],
+        "metric": np.array(METRICS)[cols],
+        "value": values[rows, cols],
+        "expected": mean[rows, cols],
+        "z": z[rows, cols],
+    }, columns=ALERT_COLUMNS)
+
+
+def backfill(df):
+    """({user_id: UserState}, alerts DataFrame) from a log frame, in one pass."""
+    rows = df[df["user_id"].notna() & df["date"].notna()]
+    if rows.empty:
+        return {}, pd.DataFrame(columns=ALERT_COLUMNS)
+    users = rows["user_id"].astype(str).to_numpy()
+    dates = rows["date"].to_numpy()
+    # Entries in (user, date) order; same-day entries keep their logged order
+    order = np.lexsort((dates, pd.factorize(users)[0]))
+    users, dates, values = users[order], dates[order], _values(rows)[order]
+
+    ew = pd.DataFrame(values, columns=METRICS).groupby(users, sort=False).ewm(alpha=ALPHA, adjust=False)
+    mean_after = ew.mean().to_numpy()
+    var_after = ew.var(bias=True).fillna(0.0).to_numpy()
+
+    first = np.r_[True, users[1:] != users[:-1]]
+    starts = np.flatnonzero(first)
+    count_before = np.arange(len(users)) - np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    # State before each entry: the previous entry's, or nothing for a user's first
+    mean_before = np.roll(mean_after, 1, axis=0)
+    var_before = np.roll(var_after, 1, axis=0)
+    mean_before[first], var_before[first] = values[first], 0.0
+
+    flagged, z = _flags(values, mean_before, var_before, count_before)
+    alerts = _alerts(users, dates, values, mean_before, flagged, z)
+
+    last = np.r_[starts[1:] - 1, len(users) - 1]
+    state = {
+        users[i]: UserState(mean_after[i], var_after[i], int(count_before[i]) + 1, dates[i])
+        for i in last
+    }
+    return state, alerts
+
+
+def step(state, values):
+    """(new state, flags, z-scores) after one entry; ``state`` may be None."""
+    if state is None:
+        return UserState(values, np.zeros_like(values), 1, None), np.zeros(len(values), dtype=bool), np.zeros(len(values))
+    flagged, z = _flags(values, state.mean, state.var, state.count)
+    diff = values - state.mean
+    incr = ALPHA * diff
+    return UserState(state.mean + incr, (1 - ALPHA) * (state.var + diff * incr), state.count + 1, None), flagged, z
+
+
+def describe(alert):
+    """One line describing an alert row."""
+    label, unit = LABELS[alert["metric"]]
+    return f"{label}: {alert['value']:.1f} {unit} on {alert['date']:%Y-%m-%d} (usually about {alert['expected']:.1f} {unit})"
+
+
+class AnomalyView:
+    """EWMA state per user and every alert raised so far."""
+
+    def __init__(self, df):
+        self.state, self.alerts = backfill(df)
+
+    def update(self, new_rows, df, removed):
+        rows = new_rows[new_rows["user_id"].notna() & new_rows["date"].notna()]
+        rows = rows.sort_values("date", kind="stable")
+        users = rows["user_id"].astype(str).to_numpy()
+        stream = len(rows) <= STREAM_MAX_ROWS
+        redo = set(removed["user_id"].dropna().astype(str)) | (set() if stream else set(users))
+        state = dict(self.state)
+        found = []
+        if stream:
+            for user_id, date, values in zip(users, rows["date"].to_numpy(), _values(rows)):
+                previous = state.get(user_id)
+                if user_id in redo or (previous is not None and date < previous.last_date):
+                    redo.add(user_id)
+                    continue
+                new, flagged, z = step(previous, values)
+                state[user_id] = new._replace(last_date=date)
+                if flagged.any():
+                    found.append(_alerts([user_id], [date], values[None], previous.mean[None], flagged[None], z[None]))
+        alerts = pd.concat([self.alerts] + found, ignore_index=True) if found else self.alerts
+        if redo:
+            redone, redone_alerts = backfill(df[df["user_id"].astype(str).isin(redo)])
+            state = {u: s for u, s in state.items() if u not in redo} | redone
+            alerts = pd.concat([alerts[~alerts["user_id"].isin(redo)], redone_alerts], ignore_index=True)
+        self.state, self.alerts = state, alerts
+
+    def for_user(self, user_id, limit=None):
+        """A user's alerts, latest first."""
+        alerts = self.alerts[self.alerts["user_id"] == str(user_id)].sort_values("date", ascending=False)
+        return alerts if limit is None else alerts.head(limit)
+
+
+register_view("anomalies", AnomalyView)
+
+
+def get_anomalies():
+    """The shared, up-to-date AnomalyView for the current log."""
+    return get_view("anomalies")
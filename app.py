@@ -3,64 +3,32 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-import matplotlib.pyplot as plt
 
-# -------------------------
-# Configuration / defaults
-# -------------------------
-#DATA_PATH = "data"
-#LOG_FILE = os.path.join(DATA_PATH, "logs.csv")
-import tempfile
-LOG_FILE = os.path.join(tempfile.gettempdir(), "logs.csv")
-
-DEFAULT_WATTAGES = {
-    "fan": 75,        # watts
-    "light": 40,      # watts (tube/led)
-    "ac": 1500,       # watts (1.5 ton typical)
-    "charger": 5,     # watts
-    "washing_machine": 500  # watts per cycle (approx average energy per cycle handled specially)
-}
-
-DEFAULT_TARIFF = 7.0            # Rs per kWh
-DEFAULT_EMISSION = 0.82         # kg CO2 per kWh
-
-# Ensure data folder exists
-#os.makedirs(DATA_PATH, exist_ok=True)
+from downsample import MAX_USER_LINES, resample_series
+from energy import APPLIANCES, DEFAULT_TARIFF, DEFAULT_EMISSION, compute_energy
+from export import FORMATS, export_logs
+from importer import PERIODS, import_responses
+from metrics import timer
+from rollups import get_rollups
+from startup import page_finished, page_started
+from tariffs import PLANS, flat_plan, get_priced
+from whatif import appliance_means, get_usage_totals, scenario
+from utils import LOG_FILE, BACKEND, get_store, init_logs, read_logs, append_log, compact_logs, import_csv_logs, archive_logs, compact_archive, delete_log, get_log_entry
 
 # Initialize log file if doesn't exist
-if not os.path.exists(LOG_FILE):
-    df_init = pd.DataFrame(columns=[
-        "user_id", "date", "period",
-        "fan_hours", "light_hours", "ac_hours", "charger_hours", "washing_cycles",
-        "kwh", "tariff_rs_per_kwh", "cost_rs", "emission_factor_kg_per_kwh", "co2_kg"
-    ])
-    df_init.to_csv(LOG_FILE, index=False)
-
-# -------------------------
-# Helper functions
-# -------------------------
-def hours_to_kwh(watt, hours):
-    """Convert watt * hours to kWh"""
-    return (watt * hours) / 1000.0
-
-def washing_cycles_to_kwh(per_cycle_watt, cycles):
-    """If washing machine watt is specified as 'per cycle energy in Wh', convert accordingly.
-       Here we assume `per_cycle_watt` is a watt-equivalent assumed running for 1 hour.
-       For simplicity, treat washing machine as per-cycle fixed kWh: (per_cycle_watt*1h)/1000 * cycles."""
-    return (per_cycle_watt * 1.0 / 1000.0) * cycles
-
-def append_log(row: dict):
-    df = pd.read_csv(LOG_FILE)
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    df.to_csv(LOG_FILE, index=False)
-
-def load_logs():
-    return pd.read_csv(LOG_FILE)
+init_logs()
 
 # -------------------------
 # Streamlit UI
 # -------------------------
 st.set_page_config(page_title="Energy Savings Habit Tracker", layout="wide")
+page_started("app")
+
+# Hidden diagnostics view: open the app with ?diagnostics in the URL
+if "diagnostics" in st.query_params:
+    import diagnostics
+    diagnostics.render()
+    st.stop()
 
 st.title("Energy Savings Habit Tracker")
 st.markdown("Log daily appliance usage, see estimated energy (kWh), cost (₹), and CO₂ (kg). Save and analyze entries.")
@@ -70,11 +38,23 @@ st.sidebar.header("App Settings")
 tariff = st.sidebar.number_input("Tariff (Rs per kWh)", value=DEFAULT_TARIFF, min_value=0.0, step=0.5, format="%.2f")
 emission_factor = st.sidebar.number_input("Emission factor (kg CO₂ per kWh)", value=DEFAULT_EMISSION, min_value=0.0, step=0.01, format="%.3f")
 st.sidebar.markdown("**Default appliance wattages (W)** — edit if you want:")
-w_fan = st.sidebar.number_input("Fan (W)", value=DEFAULT_WATTAGES["fan"], step=1)
-w_light = st.sidebar.number_input("Light (W)", value=DEFAULT_WATTAGES["light"], step=1)
-w_ac = st.sidebar.number_input("AC (W)", value=DEFAULT_WATTAGES["ac"], step=10)
-w_charger = st.sidebar.number_input("Charger (W)", value=DEFAULT_WATTAGES["charger"], step=1)
-w_washing = st.sidebar.number_input("Washing machine (W per cycle-equivalent)", value=DEFAULT_WATTAGES["washing_machine"], step=10)
+wattages = {}
+for a in APPLIANCES:
+    unit_label = "W" if a.unit == "hours" else "W per cycle-equivalent"
+    wattages[a.name] = st.sidebar.number_input(f"{a.label} ({unit_label})", value=a.watts, step=a.step)
+
+with st.sidebar.expander("Maintenance"):
+    st.caption("Saving an entry again replaces it. Compaction sorts the log and drops replaced entries and duplicate rows.")
+    if st.button("Compact log file"):
+        kept = compact_logs()
+        st.success(f"Log compacted ({kept} rows).")
+    if st.button("Archive months before this one"):
+        moved = archive_logs(before=datetime.today().date().replace(day=1))
+        compact_archive()
+        st.success(f"Moved {moved} rows into the Parquet archive.")
+    if BACKEND == "sqlite" and st.button("Import logs.csv into SQLite"):
+        imported = import_csv_logs(LOG_FILE)
+        st.success(f"Imported {imported} rows from {LOG_FILE}.")
 
 # Input form
 st.header("Log a new entry")
@@ -90,29 +70,21 @@ with st.form("log_form", clear_on_submit=False):
         st.write("")
 
     st.subheader("Appliance usage (hours)")
-    c1, c2, c3, c4, c5 = st.columns(5)
-    with c1:
-        fan_hours = st.number_input("Fan hours", min_value=0.0, value=4.0, step=0.5)
-    with c2:
-        light_hours = st.number_input("Light hours", min_value=0.0, value=4.0, step=0.5)
-    with c3:
-        ac_hours = st.number_input("AC hours", min_value=0.0, value=2.0, step=0.5)
-    with c4:
-        charger_hours = st.number_input("Charger hours", min_value=0.0, value=2.0, step=0.5)
-    with c5:
-        washing_cycles = st.number_input("Washing cycles (per day)", min_value=0, value=0, step=1, format="%d")
+    usage = {}
+    for a, c in zip(APPLIANCES, st.columns(len(APPLIANCES))):
+        with c:
+            if a.unit == "hours":
+                usage[a.column] = st.number_input(f"{a.label} hours", min_value=0.0, value=float(a.default_usage), step=0.5)
+            else:
+                usage[a.column] = int(st.number_input(f"{a.label} cycles (per day)", min_value=0, value=int(a.default_usage), step=1, format="%d"))
 
     submitted = st.form_submit_button("Calculate & Save")
 
 if submitted:
     # Calculate kWh per appliance
-    kwh_fan = hours_to_kwh(w_fan, fan_hours)
-    kwh_light = hours_to_kwh(w_light, light_hours)
-    kwh_ac = hours_to_kwh(w_ac, ac_hours)
-    kwh_charger = hours_to_kwh(w_charger, charger_hours)
-    kwh_washing = washing_cycles_to_kwh(w_washing, washing_cycles)
+    energy = compute_energy(usage, wattages).iloc[0]
 
-    total_kwh = round(kwh_fan + kwh_light + kwh_ac + kwh_charger + kwh_washing, 3)
+    total_kwh = round(float(energy["kwh"]), 3)
     cost_rs = round(total_kwh * tariff, 2)
     co2_kg = round(total_kwh * emission_factor, 3)
 
@@ -124,8 +96,8 @@ if submitted:
     # Show breakdown
     st.subheader("Breakdown (kWh)")
     breakdown = pd.DataFrame({
-        "appliance": ["fan", "light", "ac", "charger", "washing_machine"],
-        "kwh": [round(kwh_fan,3), round(kwh_light,3), round(kwh_ac,3), round(kwh_charger,3), round(kwh_washing,3)]
+        "appliance": [a.name for a in APPLIANCES],
+        "kwh": [round(float(energy[f"kwh_{a.name}"]), 3) for a in APPLIANCES]
     })
     st.table(breakdown.set_index("appliance"))
 
@@ -134,25 +106,57 @@ if submitted:
         "user_id": user_id,
         "date": pd.to_datetime(date_input).strftime("%Y-%m-%d"),
         "period": period,
-        "fan_hours": fan_hours,
-        "light_hours": light_hours,
-        "ac_hours": ac_hours,
-        "charger_hours": charger_hours,
-        "washing_cycles": int(washing_cycles),
+        **usage,
         "kwh": total_kwh,
         "tariff_rs_per_kwh": tariff,
         "cost_rs": cost_rs,
         "emission_factor_kg_per_kwh": emission_factor,
         "co2_kg": co2_kg
     }
+    # One entry per user, date and period: saving again replaces it
+    previous = get_log_entry(user_id, row["date"], period)
     append_log(row)
-    st.info(f"Saved to {LOG_FILE}")
+    if previous is None:
+        st.info(f"Saved to {get_store().path}")
+    else:
+        st.info(f"Updated the {period} entry for {user_id} on {row['date']} "
+                f"(was {previous['kwh']:.3f} kWh) in {get_store().path}")
+
+with st.expander("Delete an entry"):
+    st.caption("To correct an entry, save the form again with the same user, date and period.")
+    d1, d2, d3 = st.columns(3)
+    delete_user = d1.text_input("User ID", key="delete_user")
+    delete_date = d2.date_input("Date", value=datetime.today().date(), key="delete_date")
+    delete_period = d3.selectbox("Period", options=PERIODS, index=2, key="delete_period")
+    if st.button("Delete entry"):
+        if get_log_entry(delete_user, delete_date, delete_period) is None:
+            st.warning(f"No {delete_period} entry for {delete_user} on {delete_date:%Y-%m-%d}.")
+        else:
+            delete_log(delete_user, delete_date, delete_period)
+            st.success(f"Deleted the {delete_period} entry for {delete_user} on {delete_date:%Y-%m-%d}.")
+
+with st.expander("Bulk import (Google Forms / campaign CSV export)"):
+    st.caption("Columns are matched by name (User ID, Date, Fan hours, ...). kWh, cost and CO₂ are "
+               "computed with the current sidebar settings; rows already in the log are skipped.")
+    upload = st.file_uploader("Response export (.csv)", type="csv")
+    import_period = st.selectbox("Period for rows without one", options=PERIODS, index=2)
+    if upload is not None and st.button("Import responses"):
+        try:
+            stats = import_responses(upload, period=import_period, tariff=tariff,
+                                     emission_factor=emission_factor, wattages=wattages)
+        except ValueError as e:
+            st.error(f"Import failed: {e}")
+        else:
+            st.success(f"Imported {stats['imported']} of {stats['read']} rows "
+                       f"({stats['invalid']} invalid, {stats['duplicates']} duplicates skipped).")
 
 # -------------------------
 # Data display & analysis
 # -------------------------
 st.header("Logged entries & Analysis")
-df_logs = load_logs()
+with timer("app.load") as t:
+    df_logs = read_logs()
+    t["rows"] = len(df_logs)
 if df_logs.empty:
     st.warning("No logs yet. Add an entry above.")
 else:
@@ -160,60 +164,110 @@ else:
     st.dataframe(df_logs.sort_values("date", ascending=False).reset_index(drop=True))
 
     st.subheader("Aggregate summary")
-    agg = df_logs.groupby("user_id").agg({
-        "kwh": ["mean", "sum", "count"],
-        "cost_rs": "sum",
-        "co2_kg": "sum"
-    })
-    agg.columns = ["_".join(col).strip() for col in agg.columns.values]
+    # Per-user rollup, maintained incrementally as rows are appended
+    with timer("app.aggregate", section="summary"):
+        agg = get_rollups().summary("user")[["kwh_mean", "kwh_sum", "kwh_count", "cost_rs_sum", "co2_kg_sum"]]
     st.table(agg.reset_index())
 
+    st.subheader("Cost under a tariff plan")
+    # Logged costs use the flat rate in force when each row was saved; this
+    # re-prices the whole history (monthly slabs, time-of-day bands).
+    plans = {"flat": flat_plan(tariff), **PLANS}
+    plan_name = st.selectbox("Tariff plan", options=list(plans),
+                             format_func=lambda name: plans[name].label, key="tariff_plan")
+    with timer("app.aggregate", section="tariff"):
+        priced = get_priced(plans[plan_name])
+        by_user = df_logs[["user_id", "kwh", "cost_rs"]].join(priced.add_suffix("_plan"))
+        by_user = by_user.groupby("user_id", observed=True).agg(
+            kwh=("kwh", "sum"), logged_cost_rs=("cost_rs", "sum"),
+            plan_cost_rs=("cost_rs_plan", "sum"), plan_co2_kg=("co2_kg_plan", "sum"))
+        by_user["difference_rs"] = by_user["plan_cost_rs"] - by_user["logged_cost_rs"]
+    st.dataframe(by_user.round(2), use_container_width=True)
+
     st.subheader("Charts")
     # kWh over time per user (line)
     st.markdown("**Energy (kWh) over time**")
     users = df_logs["user_id"].unique().tolist()
     sel_user = st.selectbox("Select user for time series chart (or All)", options=["All"] + users, index=0)
 
-    plot_df = df_logs.copy()
-    plot_df["date"] = pd.to_datetime(plot_df["date"])
+    plot_df = df_logs  # dates are already datetime64 (utils.apply_schema)
 
     if sel_user != "All":
         plot_df = plot_df[plot_df["user_id"] == sel_user]
 
-    fig, ax = plt.subplots()
-    for uid, g in plot_df.groupby("user_id"):
-        g_sorted = g.sort_values("date")
-        ax.plot(g_sorted["date"], g_sorted["kwh"], marker='o', label=uid)
-    ax.set_xlabel("Date")
-    ax.set_ylabel("kWh")
-    ax.legend()
-    ax.grid(True)
-    st.pyplot(fig)
+    # Long histories are averaged into day/week/month buckets (sorted by date).
+    # With many users, "All" is one cohort-average line: hundreds of lines
+    # are unreadable and take seconds to draw.
+    with timer("app.aggregate", section="trend"):
+        if sel_user == "All" and len(users) > MAX_USER_LINES:
+            plot_df, bucket = resample_series(plot_df.groupby("date", as_index=False)["kwh"].mean())
+            plot_df = plot_df.assign(user_id="All users (average)")
+        else:
+            plot_df, bucket = resample_series(plot_df, by="user_id")
+
+    with timer("app.chart", section="trend"):
+        import matplotlib.pyplot as plt  # deferred until a chart is drawn (see startup.py)
+        fig, ax = plt.subplots()
+        for uid, g in plot_df.groupby("user_id", observed=True):
+            ax.plot(g["date"], g["kwh"], marker='o', label=uid)
+        ax.set_xlabel("Date")
+        ax.set_ylabel("kWh")
+        ax.legend()
+        ax.grid(True)
+        st.pyplot(fig)
+        plt.close(fig)
+    if bucket != "raw":
+        st.caption(f"Showing average kWh per {bucket} to keep the chart responsive.")
 
     st.markdown("**Average appliance-wise kWh across all logs**")
-    # compute appliance-wise kWh using reverse calculation from hours and wattages.
-    # We'll compute a simple avg by re-calculating per-row with the current wattages.
-    rew = df_logs.copy()
-    rew["kwh_fan_calc"] = (w_fan * rew["fan_hours"]) / 1000.0
-    rew["kwh_light_calc"] = (w_light * rew["light_hours"]) / 1000.0
-    rew["kwh_ac_calc"] = (w_ac * rew["ac_hours"]) / 1000.0
-    rew["kwh_charger_calc"] = (w_charger * rew["charger_hours"]) / 1000.0
-    rew["kwh_washing_calc"] = (w_washing * 1.0 / 1000.0) * rew["washing_cycles"]
-
-    app_avg = pd.DataFrame({
-        "appliance": ["fan", "light", "ac", "charger", "washing_machine"],
-        "avg_kwh": [
-            round(rew["kwh_fan_calc"].mean(), 3),
-            round(rew["kwh_light_calc"].mean(), 3),
-            round(rew["kwh_ac_calc"].mean(), 3),
-            round(rew["kwh_charger_calc"].mean(), 3),
-            round(rew["kwh_washing_calc"].mean(), 3)
-        ]
-    })
-    st.bar_chart(app_avg.set_index("appliance"))
+    # Priced with the current wattages from cached usage totals, not per row.
+    with timer("app.aggregate", section="appliances"):
+        usage_totals = get_usage_totals()
+        app_avg = appliance_means(usage_totals.table, wattages).round(3).rename("avg_kwh")
+    with timer("app.chart", section="appliances"):
+        st.bar_chart(app_avg.rename_axis("appliance").to_frame())
 
-    st.markdown("**Download full logs**")
-    csv = df_logs.to_csv(index=False).encode('utf-8')
-    st.download_button("Download logs as CSV", data=csv, file_name="energy_logs.csv", mime="text/csv")
+    st.markdown("**What-if: logged history with the current sidebar settings**")
+    st.caption("Compares the kWh, cost and CO₂ stored with each entry against the same usage "
+               "at the sidebar wattages, tariff and emission factor.")
+    whatif_level = st.radio("Group by", options=["user_id", "period", "user and period"],
+                            horizontal=True, key="whatif_level")
+    with timer("app.aggregate", section="whatif"):
+        totals = usage_totals.by(None if whatif_level == "user and period" else whatif_level)
+        what_if = scenario(totals, wattages, tariff, emission_factor)
+    st.dataframe(what_if[["rows", "logged_kwh", "kwh", "kwh_change", "logged_cost_rs", "cost_rs",
+                          "cost_rs_change", "logged_co2_kg", "co2_kg", "co2_kg_change"]].round(2),
+                 use_container_width=True)
 
+    st.markdown("**Download logs**")
+    # The file is only written when asked for, and reused while the log and
+    # the filters stay the same.
+    first_day, last_day = df_logs["date"].min().date(), df_logs["date"].max().date()
+    ex1, ex2, ex3, ex4 = st.columns(4)
+    with ex1:
+        export_user = st.selectbox("User", options=["All"] + users, key="export_user")
+    with ex2:
+        export_period = st.selectbox("Period", options=["All"] + PERIODS, key="export_period")
+    with ex3:
+        export_range = st.date_input("Dates", value=(first_day, last_day), key="export_range")
+    with ex4:
+        export_format = st.selectbox("Format", options=list(FORMATS), key="export_format")
+    export_start, export_end = export_range if len(export_range) == 2 else (None, None)
+    if (export_start, export_end) == (first_day, last_day):  # whole log, undated rows too
+        export_start = export_end = None
+    request = {
+        "fmt": export_format,
+        "user_id": None if export_user == "All" else export_user,
+        "period": None if export_period == "All" else export_period,
+        "start": export_start,
+        "end": export_end,
+    }
+    if st.button("Prepare download"):
+        st.session_state["export"] = (request, export_logs(**request))
+    prepared = st.session_state.get("export")
+    if prepared and prepared[0] == request and os.path.exists(prepared[1]):
+        ext, mime = FORMATS[export_format]
+        with open(prepared[1], "rb") as f:
+            st.download_button(f"Download logs ({export_format})", data=f, file_name=f"energy_logs{ext}", mime=mime)
 
+page_finished()
@@ -0,0 +1,165 @@
+"""Columnar Parquet archive for old log rows.
+
+Archived rows live under one directory, partitioned by month and optionally
+by user::
+
+    <root>/month=2026-09/part-<time>-<id>.parquet
+    <root>/month=2026-09/user=User01/part-<time>-<id>.parquet
+
+Every file holds the full log schema, so both layouts can be read together.
+Part files are named after the time they were written and read in that
+order, so when an entry was archived again after a correction, the later
+row wins, as in the log (files from before this naming are read first).
+Readers skip whole partitions that cannot match a user or date filter
+and ask Parquet for only the requested columns.
+
+Needs pyarrow (installed with Streamlit); it is imported on first use.
+"""
+import glob
+import os
+import re
+import time
+import uuid
+from urllib.parse import quote
+
+import pandas as pd
+
+from storage import KEY_COLUMNS
+
+NO_DATE = "none"   # month partition for rows without a valid date
+_TIMED_PART = re.compile(r"part-(\d{20})-")
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("The Parquet archive needs pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _month_dirs(root, start=None, end=None):
+    lo = pd.Timestamp(start).strftime("%Y-%m") if start is not None else None
+    hi = pd.Timestamp(end).strftime("%Y-%m") if end is not None else None
+    for path in sorted(glob.glob(os.path.join(root, "month=*"))):
+        month = os.path.basename(path).split("=", 1)[1]
+        if month == NO_DATE:
+            if lo is None and hi is None:
+                yield path
+            continue
+        if (lo is None or month >= lo) and (hi is None or month <= hi):
+            yield path
+
+
+def archive_files(root, user_id=None, start=None, end=None):
+    """Parquet files that may hold rows for the given user / date range."""
+    files = []
+    for month_dir in _month_dirs(root, start, end):
+        files += glob.glob(os.path.join(month_dir, "*.parquet"))
+        user_dirs = glob.glob(os.path.join(month_dir, "user=*"))
+        if user_id is not None:
+            wanted = os.path.join(month_dir, "user=" + quote(str(user_id), safe=""))
+            user_dirs = [d for d in user_dirs if d == wanted]
+        for d in user_dirs:
+            files += glob.glob(os.path.join(d, "*.parquet"))
+    return sorted(files, key=_write_order)
+
+
+def _write_order(path):
+    name = os.path.basename(path)
+    timed = _TIMED_PART.match(name)
+    return (1, timed.group(1), name) if timed else (0, "", name)
+
+
+def read_archive(root, headers, user_id=None, start=None, end=None, period=None, columns=None):
+    """Archived rows matching the filters, with only ``columns`` read from disk."""
+    columns = list(columns) if columns is not None else list(headers)
+    files = archive_files(root, user_id, start, end) if os.path.isdir(root) else []
+    if not files:
+        return pd.DataFrame(columns=columns)
+    pa, pq = _pyarrow()
+
+    filters = []
+    if user_id is not None:
+        filters.append(("user_id", "=", str(user_id)))
+    if period is not None:
+        filters.append(("period", "=", str(period)))
+    if start is not None:
+        filters.append(("date", ">=", pd.Timestamp(start).normalize()))
+    if end is not None:
+        filters.append(("date", "<=", pd.Timestamp(end).normalize()))
+    # Filter columns are read for the predicate even when not returned.
+    needed = list(dict.fromkeys(columns + [f[0] for f in filters]))
+
+    tables = [_decoded(pa, pq.read_table(f, columns=needed, filters=filters or None)) for f in files]
+    df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    return df[columns]
+
+
+def _decoded(pa, table):
+    """``table`` with dictionary (categorical) columns cast to their values,
+    so parts written with and without them concatenate."""
+    schema = pa.schema([f.with_type(f.type.value_type) if pa.types.is_dictionary(f.type) else f
+                        for f in table.schema])
+    return table.cast(schema)
+
+
+def _write_file(directory, df):
+    pa, pq = _pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def _month_keys(df):
+    return df["date"].dt.strftime("%Y-%m").fillna(NO_DATE)
+
+
+def write_partitions(root, df, partition_by_user=False):
+    """Write typed log rows into the archive. Returns the files written."""
+    written = []
+    if df.empty:
+        return written
+    for month, part in df.groupby(_month_keys(df).to_numpy()):
+        month_dir = os.path.join(root, f"month={month}")
+        if not partition_by_user:
+            written.append(_write_file(month_dir, part))
+            continue
+        for user, user_part in part.groupby(part["user_id"].astype(str).to_numpy()):
+            written.append(_write_file(os.path.join(month_dir, "user=" + quote(user, safe="")), user_part))
+    return written
+
+
+def compact_archive(root):
+    """Merge the part files of each partition into one file, keeping only the
+    last row written per (user_id, date, period). Returns the files removed.
+
+    An entry's rows all fall in one month, so each month (with its user
+    partitions) is merged on its own.
+    """
+    pa, pq = _pyarrow()
+    removed = 0
+    for month_dir in glob.glob(os.path.join(root, "month=*")):
+        parts = sorted(glob.glob(os.path.join(month_dir, "*.parquet")) +
+                       glob.glob(os.path.join(month_dir, "user=*", "*.parquet")), key=_write_order)
+        if len(parts) < 2:
+            continue
+        tables = [pq.read_table(p) for p in parts]
+        frames = [t.to_pandas().assign(_dir=os.path.dirname(p)) for t, p in zip(tables, parts)]
+        df = pd.concat(frames, ignore_index=True)
+        keyed = df[KEY_COLUMNS].notna().all(axis=1)
+        df = df[~(keyed & df.duplicated(subset=KEY_COLUMNS, keep="last"))]
+        # concat turns categoricals with different categories into objects;
+        # keep them categorical so the merged file is written like the others
+        categorical = {f.name for t in tables for f in t.schema if pa.types.is_dictionary(f.type)}
+        df = df.astype({c: "category" for c in categorical})
+        for directory, part in df.groupby("_dir"):
+            _write_file(directory, part.drop(columns="_dir"))
+        for p in parts:
+            os.remove(p)
+        removed += len(parts)
+    return removed
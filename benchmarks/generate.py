@@ -0,0 +1,108 @@
+"""Synthetic energy logs for load testing.
+
+Usage (from the repository root):
+    python -m benchmarks.generate 100k --out /tmp/logs.csv
+    python -m benchmarks.generate 10M              # append to the app's log
+
+Each user logs on most days of a few months, with gaps that break their
+streaks. The first half of a user's days is the "baseline" period and the
+rest is "post", where usage drops a little as habits change. Rows follow
+utils.HEADERS, with kWh, cost and CO₂ computed the way app.py computes them.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, DEFAULT_EMISSION, DEFAULT_TARIFF, compute_energy
+from utils import HEADERS, append_log_batches
+
+ROWS_PER_USER = 150      # about five months of daily logs
+CHUNK_ROWS = 1_000_000   # rows generated per batch
+START = "2025-01-01"
+
+# Typical daily use and spread per appliance (hours, or cycles for the washer)
+_USAGE = {"fan": (6.0, 2.5), "light": (4.0, 1.5), "ac": (1.5, 1.5), "charger": (2.0, 1.0), "washing_machine": (0.4, None)}
+
+
+def parse_rows(text):
+    """'1k' -> 1000, '10M' -> 10000000."""
+    text = str(text).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _users_frame(rng, first_user, n_users, rows, start):
+    counts = np.full(n_users, rows // n_users)
+    counts[: rows % n_users] += 1
+    user = np.repeat(np.arange(n_users), counts)
+    # Days between logs: mostly 1, with gaps more likely for casual users.
+    p_daily = rng.uniform(0.6, 0.97, n_users)
+    gaps = rng.geometric(p_daily[user])
+    day = np.cumsum(gaps)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    day = day - day[first] + rng.integers(0, 60, n_users)[user]
+    position = np.arange(len(user)) - first
+    post = position >= counts[user] // 2
+
+    df = pd.DataFrame({
+        "user_id": np.array([f"User{first_user + i:05d}" for i in range(n_users)])[user],
+        "date": (pd.Timestamp(start) + pd.to_timedelta(day, unit="D")).strftime("%Y-%m-%d"),
+        "period": np.where(post, "post", "baseline"),
+    })
+    saving = np.where(post, rng.uniform(0.7, 1.0, n_users)[user], 1.0)
+    for a in APPLIANCES:
+        mean, spread = _USAGE.get(a.name, (a.default_usage, 1.0))
+        if a.unit == "hours":
+            usual = np.clip(rng.normal(mean, spread, n_users), 0, 24)[user]
+            df[a.column] = np.clip(rng.normal(usual * saving, 0.5), 0, 24).round(1)
+        else:
+            df[a.column] = rng.poisson(mean * saving)
+    df["tariff_rs_per_kwh"] = DEFAULT_TARIFF
+    df["emission_factor_kg_per_kwh"] = DEFAULT_EMISSION
+    df["kwh"] = compute_energy(df)["kwh"].round(3)
+    df["cost_rs"] = (df["kwh"] * df["tariff_rs_per_kwh"]).round(2)
+    df["co2_kg"] = (df["kwh"] * df["emission_factor_kg_per_kwh"]).round(3)
+    return df[HEADERS]
+
+
+def generate_batches(rows, rows_per_user=ROWS_PER_USER, start=START, seed=0, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames totalling ``rows`` synthetic log rows, a whole number of users each."""
+    rng = np.random.default_rng(seed)
+    n_users = max(1, rows // rows_per_user)
+    users_per_chunk = max(1, chunk_rows // rows_per_user)
+    done_rows = 0
+    for first in range(0, n_users, users_per_chunk):
+        n = min(users_per_chunk, n_users - first)
+        # The last chunk absorbs the remainder so the total is exact.
+        chunk = rows - done_rows if first + n >= n_users else n * (rows // n_users)
+        done_rows += chunk
+        yield _users_frame(rng, first, n, chunk, start)
+
+
+def generate_logs(rows, **kwargs):
+    """``rows`` synthetic log rows as one DataFrame (see generate_batches)."""
+    return pd.concat(generate_batches(rows, **kwargs), ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic energy logs.")
+    parser.add_argument("rows", help="number of rows, e.g. 1000, 100k, 10M")
+    parser.add_argument("--out", help="write a CSV file here instead of appending to the app's log")
+    parser.add_argument("--rows-per-user", type=int, default=ROWS_PER_USER)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    batches = generate_batches(parse_rows(args.rows), rows_per_user=args.rows_per_user, seed=args.seed)
+    if args.out:
+        total = 0
+        for i, df in enumerate(batches):
+            df.to_csv(args.out, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            total += len(df)
+    else:
+        total = append_log_batches(batches)
+    print(f"wrote {total} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Time and peak memory of the tracker's hot paths at growing log sizes.
+
+Usage (from the repository root):
+    python -m benchmarks.run                         # 1k, 100k and 10M rows
+    python -m benchmarks.run --sizes 1k,100k --json bench.jsonl
+    ENERGY_LOG_BACKEND=sqlite python -m benchmarks.run --sizes 100k
+
+Each size runs in its own subprocess against a fresh temporary log, filled
+by benchmarks.generate, so the app's real log is never touched and caches
+don't carry over between sizes. After a warm-up run, a case reports its
+best wall time over --repeat runs and the peak traced memory (tracemalloc)
+of one more run.
+The 10M-row size needs several GB of RAM and takes minutes.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SIZES = ["1k", "100k", "10M"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, repeat):
+    """(best seconds over ``repeat`` runs, peak MB of one traced run).
+
+    One untimed run comes first, so maintained views are already built.
+    """
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def cases():
+    """(name, fn) pairs, run in order against the generated log."""
+    import utils
+    from rollups import LatestRows, Rollups, get_latest, get_rollups
+    from streaks import compute_streaks
+    from tips import compute_tips, get_tips
+
+    some_user = utils.list_users()[0]
+
+    def read_cold():
+        utils._cache = utils._LogCache()   # drop the process-wide cache
+        return utils.read_logs()
+
+    new_days = itertools.count()
+
+    def append_one():
+        # A day not logged yet, so every run appends rather than replaces
+        date = datetime.date(2030, 1, 1) + datetime.timedelta(days=next(new_days))
+        utils.append_log({"user_id": some_user, "date": date.isoformat(), "period": "post", "kwh": 1.0})
+        return utils.read_logs()           # picks up just the new row
+
+    def replace_one():
+        utils.append_log({"user_id": some_user, "date": "2030-01-01", "period": "post", "kwh": 2.0})
+        return utils.read_logs()           # drops the old row, adds the new one
+
+    return [
+        ("read_logs (cold)", read_cold),
+        ("read_logs (cached)", utils.read_logs),
+        ("read_logs (one user)", lambda: utils.read_logs(user_id=some_user)),
+        ("append_log + refresh", append_one),
+        ("replace entry + refresh", replace_one),
+        ("summary (full rollup)", lambda: Rollups(utils.read_logs()).summary("user")),
+        ("summary (maintained)", lambda: get_rollups().summary("user")),
+        ("streaks (all users)", lambda: compute_streaks(utils.read_logs())),
+        ("tips (all users)", lambda: compute_tips(LatestRows(utils.read_logs()).table)),
+        ("tips (maintained)", lambda: get_tips().for_user(some_user)),
+        ("latest rows (all users)", lambda: LatestRows(utils.read_logs()).table),
+        ("latest rows (maintained)", get_latest),
+    ]
+
+
+def run_size(rows, repeat):
+    """Benchmark one size in this process. Yields result dicts."""
+    import utils
+    from benchmarks.generate import generate_batches
+
+    t0 = time.perf_counter()
+    utils.init_logs()
+    utils.append_log_batches(generate_batches(rows))
+    yield {"case": "bulk load", "seconds": time.perf_counter() - t0, "peak_mb": None}
+    for name, fn in cases():
+        seconds, peak_mb = measure(fn, repeat)
+        yield {"case": name, "seconds": seconds, "peak_mb": peak_mb}
+
+
+def _child(rows, repeat):
+    # Point every log path at a fresh directory before utils is imported
+    # (benchmarks.generate imports it too, so that import waits as well).
+    tempfile.tempdir = workdir = tempfile.mkdtemp(prefix="energy-bench-")
+    backend = os.environ.get("ENERGY_LOG_BACKEND", "csv")
+    try:
+        for result in run_size(rows, repeat):
+            print(json.dumps({"rows": rows, "backend": backend, **result}), flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the energy tracker at several log sizes.")
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma-separated row counts, e.g. 1k,100k,10M")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (best is reported)")
+    parser.add_argument("--json", help="append results to this JSON-lines file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        _child(args.child, args.repeat)
+        return
+    from benchmarks.generate import parse_rows
+
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print(f"{'rows':>10}  {'case':<26} {'seconds':>10} {'peak MB':>9}")
+    for size in args.sizes.split(","):
+        rows = parse_rows(size)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.run", "--child", str(rows), "--repeat", str(args.repeat)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        for line in proc.stdout:
+            result = json.loads(line)
+            peak = "" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+            print(f"{rows:>10}  {result['case']:<26} {result['seconds']:>10.4f} {peak:>9}", flush=True)
+            if args.json:
+                with open(args.json, "a") as f:
+                    f.write(json.dumps({"time": stamp, **result}) + "\n")
+        if proc.wait():
+            sys.exit(f"benchmark for {rows} rows failed (exit {proc.returncode})")
+
+
+if __name__ == "__main__":
+    main()
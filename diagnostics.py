@@ -0,0 +1,52 @@
+"""Diagnostics view: stage timings, cache counters and recent metrics records.
+
+Not listed in the page navigation; open the app with ``?diagnostics`` in the
+URL (e.g. http://localhost:8501/?diagnostics) to see it.
+"""
+import pandas as pd
+import streamlit as st
+
+from metrics import METRICS_FILE, read_recent, reset, snapshot
+from utils import BACKEND, log_version
+
+
+def _timer_table(timers):
+    table = pd.DataFrame.from_dict(timers, orient="index")
+    if table.empty:
+        return table
+    table["mean_ms"] = table["total_ms"] / table["count"]
+    table = table[["count", "mean_ms", "max_ms", "last_ms", "total_ms"]]
+    return table.sort_values("total_ms", ascending=False).round(2)
+
+
+def render():
+    st.title("Diagnostics")
+    st.caption(f"Backend: {BACKEND} · log version {log_version()} · metrics file {METRICS_FILE}")
+
+    stats = snapshot()
+    counters = stats["counters"]
+    hits, misses = counters.get("cache.hit", 0), counters.get("cache.reload", 0) + counters.get("cache.refresh", 0)
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Log cache hits", hits)
+    c2.metric("Log cache misses", misses, help="full reloads + incremental refreshes")
+    c3.metric("Rows read", counters.get("log.rows_read", 0))
+    c4.metric("MB read", f"{counters.get('log.bytes_read', 0) / 2**20:.1f}")
+
+    st.subheader("Stage timings (this server process)")
+    st.dataframe(_timer_table(stats["timers"]), use_container_width=True)
+
+    st.subheader("Counters")
+    st.dataframe(pd.Series(counters, name="value").sort_index(), use_container_width=True)
+    if st.button("Reset counters and timings"):
+        reset()
+        st.rerun()
+
+    st.subheader("Recent stages (all processes)")
+    recent = pd.DataFrame(read_recent(500))
+    if recent.empty:
+        st.info("No metrics recorded yet.")
+        return
+    recent["ts"] = pd.to_datetime(recent["ts"], unit="s")
+    slowest = recent.groupby("stage")["ms"].describe(percentiles=[0.5, 0.95])[["count", "50%", "95%", "max"]]
+    st.dataframe(slowest.sort_values("95%", ascending=False).round(2), use_container_width=True)
+    st.dataframe(recent.iloc[::-1], use_container_width=True)
@@ -0,0 +1,95 @@
+"""Bound the number of points sent to time-series charts.
+
+Series are first averaged into day, week or month buckets, whichever is the
+finest that fits the point budget for the range shown. If a series is
+still too long, Largest-Triangle-Three-Buckets (LTTB) keeps the points that
+best preserve its shape.
+
+With more series than the budget gives MIN_POINTS_PER_SERIES each, only the
+series with the largest totals are kept; charts with many users should draw
+one cohort line above MAX_USER_LINES instead.
+"""
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 2000          # budget for a whole chart
+MIN_POINTS_PER_SERIES = 30
+MAX_USER_LINES = 20        # above this many users, trend charts draw the cohort average
+
+# (bucket label, pandas frequency, approximate days per bucket), finest first
+BUCKETS = [("day", "D", 1), ("week", "W", 7), ("month", "MS", 30.4)]
+
+
+def choose_bucket(start, end, max_points):
+    """The finest bucket that puts at most ``max_points`` buckets between start and end."""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for label, freq, width in BUCKETS:
+        if days / width <= max_points:
+            return label, freq
+    return BUCKETS[-1][:2]
+
+
+def lttb(x, y, n_out):
+    """Indices of ``n_out`` points chosen by Largest-Triangle-Three-Buckets.
+
+    ``x`` must be sorted and numeric. The first and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (n_out - 2)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _lttb_frame(frame, x, y, n_out):
+    if len(frame) <= n_out:
+        return frame
+    xs = frame[x].to_numpy().astype("datetime64[s]").astype(np.int64)
+    return frame.iloc[lttb(xs, frame[y].to_numpy(), n_out)]
+
+
+def resample_series(df, x="date", y="kwh", by=None, max_points=MAX_POINTS):
+    """Chart-ready copy of ``df[[x, y, by]]`` with a bounded number of points.
+
+    The point budget is shared between the series in ``by`` (e.g. one line
+    per user); if it can't give each at least MIN_POINTS_PER_SERIES, the
+    series with the smallest ``y`` totals are left out. Returns (frame,
+    bucket) where bucket is "raw", "day", "week" or "month", for use in a
+    caption.
+    """
+    cols = [x, y] + ([by] if by else [])
+    data = df[cols].dropna(subset=[x])
+    if len(data) <= max_points:
+        return data.sort_values(x), "raw"
+
+    n_series = data[by].nunique() if by else 1
+    max_series = max(max_points // MIN_POINTS_PER_SERIES, 1)
+    if n_series > max_series:
+        top = data.groupby(by, observed=True)[y].sum().nlargest(max_series).index
+        data = data[data[by].isin(top)]
+        n_series = max_series
+    per_series = max_points // n_series
+    label, freq = choose_bucket(data[x].min(), data[x].max(), per_series)
+    keys = ([by] if by else []) + [pd.Grouper(key=x, freq=freq)]
+    grouped = data.groupby(keys, observed=True)[y].mean().dropna().reset_index()
+
+    if by:
+        parts = [_lttb_frame(g, x, y, per_series) for _, g in grouped.groupby(by, observed=True, sort=False)]
+        grouped = pd.concat(parts, ignore_index=True)
+    else:
+        grouped = _lttb_frame(grouped, x, y, per_series)
+    return grouped, label
@@ -0,0 +1,68 @@
+"""Appliance table and the vectorized kWh / cost / CO₂ calculation.
+
+Every page that turns usage into energy goes through compute_energy(), so
+adding an appliance is one more row in APPLIANCES.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# unit is "hours" (usage logged in hours) or "cycles" (usage logged as a count;
+# watts is then a watt-equivalent running for HOURS_PER_CYCLE per cycle).
+Appliance = namedtuple("Appliance", ["name", "label", "column", "watts", "unit", "step", "default_usage"])
+
+APPLIANCES = [
+    Appliance("fan", "Fan", "fan_hours", 75, "hours", 1, 4.0),
+    Appliance("light", "Light", "light_hours", 40, "hours", 1, 4.0),                       # tube/led
+    Appliance("ac", "AC", "ac_hours", 1500, "hours", 10, 2.0),                             # 1.5 ton typical
+    Appliance("charger", "Charger", "charger_hours", 5, "hours", 1, 2.0),
+    Appliance("washing_machine", "Washing machine", "washing_cycles", 500, "cycles", 10, 0),
+]
+
+HOURS_PER_CYCLE = 1.0
+
+DEFAULT_WATTAGES = {a.name: a.watts for a in APPLIANCES}
+DEFAULT_TARIFF = 7.0            # Rs per kWh
+DEFAULT_EMISSION = 0.82         # kg CO2 per kWh
+
+USAGE_COLUMNS = [a.column for a in APPLIANCES]
+KWH_COLUMNS = [f"kwh_{a.name}" for a in APPLIANCES]
+
+
+def kwh_per_unit(wattages=None):
+    """kWh for one hour (or one cycle) of each appliance, in APPLIANCES order."""
+    wattages = {**DEFAULT_WATTAGES, **(wattages or {})}
+    hours = [1.0 if a.unit == "hours" else HOURS_PER_CYCLE for a in APPLIANCES]
+    return np.array([wattages[a.name] for a in APPLIANCES], dtype=float) * np.array(hours) / 1000.0
+
+
+def usage_matrix(data):
+    """(rows × appliances) usage array from a DataFrame or a single-row dict.
+
+    Missing columns and missing values count as zero usage.
+    """
+    if isinstance(data, dict):
+        data = pd.DataFrame([data])
+    usage = np.zeros((len(data), len(APPLIANCES)))
+    for i, col in enumerate(USAGE_COLUMNS):
+        if col in data.columns:
+            usage[:, i] = pd.to_numeric(data[col], errors="coerce").to_numpy(dtype=float, na_value=0.0)
+    return usage
+
+
+def compute_energy(data, wattages=None, tariff=DEFAULT_TARIFF, emission_factor=DEFAULT_EMISSION):
+    """Per-appliance kWh plus total kWh, cost (Rs) and CO₂ (kg) for every row.
+
+    ``data`` is a log DataFrame or one row as a dict; ``tariff`` and
+    ``emission_factor`` may be scalars or per-row arrays (e.g. the stored
+    ``tariff_rs_per_kwh`` column). Values are not rounded.
+    """
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    per_appliance = usage_matrix(data) * kwh_per_unit(wattages)
+    total = per_appliance.sum(axis=1)
+    out = pd.DataFrame(per_appliance, columns=KWH_COLUMNS, index=index)
+    out["kwh"] = total
+    out["cost_rs"] = total * np.asarray(tariff, dtype=float)
+    out["co2_kg"] = total * np.asarray(emission_factor, dtype=float)
+    return out
@@ -0,0 +1,117 @@
+"""Filtered log exports as CSV, gzip CSV or Parquet.
+
+Rows are encoded a chunk at a time into a file on disk, so an export never
+holds a second full text copy of the log in memory. Finished exports are
+kept under EXPORT_DIR, keyed on the request and the log's version: asking
+again for the same export before the log changes reuses the file.
+"""
+import glob
+import gzip
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+
+from metrics import count, timer
+from utils import log_version, read_logs
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "log_exports")
+CHUNK_ROWS = 50_000
+MAX_CACHED = 20   # finished exports kept on disk
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _chunks(df):
+    for i in range(0, max(len(df), 1), CHUNK_ROWS):
+        yield df.iloc[i:i + CHUNK_ROWS]
+
+
+def _write_csv(df, f):
+    for i, chunk in enumerate(_chunks(df)):
+        f.write(chunk.to_csv(index=False, header=i == 0, date_format="%Y-%m-%d").encode("utf-8"))
+
+
+def _write_parquet(df, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from e
+    writer = None
+    try:
+        # One row group per chunk
+        for chunk in _chunks(df):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _cache_key(fmt, filters):
+    request = repr((log_version(), fmt, sorted(filters.items())))
+    return hashlib.sha1(request.encode("utf-8")).hexdigest()[:16]
+
+
+def _prune(keep):
+    files = sorted(glob.glob(os.path.join(EXPORT_DIR, "export-*")), key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        try:
+            os.remove(path)
+        except OSError:  # in use or already gone
+            pass
+
+
+def _write_export(df, fmt, path):
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "csv":
+                _write_csv(df, f)
+            elif fmt == "csv.gz":
+                with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+                    _write_csv(df, gz)
+        if fmt == "parquet":
+            _write_parquet(df, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def export_logs(fmt="csv", user_id=None, start=None, end=None, period=None):
+    """Write the matching log rows in ``fmt`` (see FORMATS) and return the file path.
+
+    Dates in ``start``/``end`` are inclusive, as in read_logs().
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {sorted(FORMATS)}")
+    filters = {
+        "user_id": None if user_id is None else str(user_id),
+        "start": None if start is None else pd.Timestamp(start).strftime("%Y-%m-%d"),
+        "end": None if end is None else pd.Timestamp(end).strftime("%Y-%m-%d"),
+        "period": None if period is None else str(period),
+    }
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"export-{_cache_key(fmt, filters)}{FORMATS[fmt][0]}")
+    if os.path.exists(path):
+        count("export.hit")
+        os.utime(path)  # most recently used
+        return path
+
+    count("export.miss")
+    with timer("export.write", fmt=fmt) as t:
+        df = read_logs(**filters)
+        t["rows"] = len(df)
+        _write_export(df, fmt, path)
+    _prune(MAX_CACHED)
+    return path
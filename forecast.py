@@ -0,0 +1,170 @@
+"""Month-end kWh, cost and CO₂ projections for every user.
+
+Each user's model is kWh per entry = weekday level + slope × day, fitted by
+least squares on their whole history. Both the fit and the month totals
+only need sums that add up across rows. Per user, those sums are:
+
+* entries, Σt and ΣkWh for each weekday
+* Σt² and Σt·kWh overall
+
+The view keeps these sums and refits, in one vectorized solve, only the
+users with new rows. Removed rows (replaced or deleted entries) are
+subtracted from the sums the same way.
+
+The projection for a user is the kWh already logged in the month of their
+latest entry, plus the model's prediction for each remaining day of that
+month. Predicted days are priced at the tariff and emission factor of the
+user's latest entry.
+"""
+import numpy as np
+import pandas as pd
+
+from utils import get_view, register_view
+
+EPOCH = np.datetime64("2020-01-01", "D")
+MIN_TREND_ENTRIES = 14   # fewer entries: weekday levels only, no trend
+WEEKDAYS = range(7)
+
+STAT_COLUMNS = ([f"n_{d}" for d in WEEKDAYS] + [f"st_{d}" for d in WEEKDAYS] +
+                [f"sy_{d}" for d in WEEKDAYS] + ["stt", "sty"])
+MONTH_METRICS = ["kwh", "cost_rs", "co2_kg"]
+
+
+def _valid(df):
+    return df[df["user_id"].notna() & df["date"].notna() & df["kwh"].notna()]
+
+
+def _days(dates):
+    return (dates.to_numpy(dtype="datetime64[D]") - EPOCH).astype(np.int64)
+
+
+def sufficient_stats(df):
+    """STAT_COLUMNS per user (``t`` is days since EPOCH, y is kWh per entry)."""
+    rows = _valid(df)
+    codes, users = pd.factorize(rows["user_id"].astype(str))
+    t = _days(rows["date"]).astype(float)
+    y = rows["kwh"].to_numpy(dtype=float)
+    cell = codes * 7 + rows["date"].dt.dayofweek.to_numpy()
+    size = len(users) * 7
+
+    def per_weekday(weights=None):
+        return np.bincount(cell, weights, minlength=size).reshape(len(users), 7)
+
+    out = np.hstack([per_weekday(), per_weekday(t), per_weekday(y),
+                     np.bincount(codes, t * t, minlength=len(users))[:, None],
+                     np.bincount(codes, t * y, minlength=len(users))[:, None]])
+    return pd.DataFrame(out, columns=STAT_COLUMNS, index=pd.Index(users, name="user_id"))
+
+
+def latest_entries(df):
+    """Date, tariff and emission factor of each user's latest entry (last saved on ties)."""
+    rows = _valid(df).sort_values("date", kind="stable")
+    latest = rows.groupby(rows["user_id"].astype(str)).tail(1)
+    out = latest[["date", "tariff_rs_per_kwh", "emission_factor_kg_per_kwh"]].astype(
+        {"tariff_rs_per_kwh": "float64", "emission_factor_kg_per_kwh": "float64"})
+    out = out.rename(columns={"date": "as_of"})
+    out.index = pd.Index(latest["user_id"].astype(str), name="user_id")
+    return out
+
+
+def month_totals(df):
+    """kWh, cost and CO₂ logged per (user_id, month start)."""
+    rows = _valid(df)
+    keys = [rows["user_id"].astype(str).rename("user_id"), rows["date"].dt.to_period("M").dt.start_time.rename("month")]
+    return rows[MONTH_METRICS].astype("float64").groupby(keys).sum()
+
+
+def fit(stats):
+    """(weekday levels (users × 7), slope per day) from sufficient statistics."""
+    n = stats[[f"n_{d}" for d in WEEKDAYS]].to_numpy()
+    st = stats[[f"st_{d}" for d in WEEKDAYS]].to_numpy()
+    sy = stats[[f"sy_{d}" for d in WEEKDAYS]].to_numpy()
+    seen = n > 0
+    safe_n = np.where(seen, n, 1)
+    # Normal equations with the weekday levels eliminated:
+    # slope = (Σty − Σ_d St_d·Sy_d/n_d) / (Σt² − Σ_d St_d²/n_d)
+    num = stats["sty"].to_numpy() - (st * sy / safe_n).sum(axis=1)
+    den = stats["stt"].to_numpy() - (st * st / safe_n).sum(axis=1)
+    use_trend = (n.sum(axis=1) >= MIN_TREND_ENTRIES) & (den > 1e-9 * np.maximum(stats["stt"].to_numpy(), 1))
+    slope = np.where(use_trend, num / np.where(use_trend, den, 1), 0.0)
+    levels = (sy - slope[:, None] * st) / safe_n
+    # Weekdays never logged take the mean level of the others
+    fill = np.nanmean(np.where(seen, levels, np.nan), axis=1)
+    levels = np.where(seen, levels, fill[:, None])
+    return levels, slope
+
+
+def project(stats, latest, months):
+    """Month-end projection per user in ``stats`` (a DataFrame indexed by user_id)."""
+    latest = latest.reindex(stats.index)
+    levels, slope = fit(stats)
+    as_of = latest["as_of"]
+    t0 = _days(as_of)
+    dow0 = as_of.dt.dayofweek.to_numpy()
+    remaining = (as_of.dt.days_in_month - as_of.dt.day).to_numpy()
+    ahead = np.arange(1, 32)
+    mask = ahead[None, :] <= remaining[:, None]
+    weekday = (dow0[:, None] + ahead[None, :]) % 7
+    per_day = np.take_along_axis(levels, weekday, axis=1) + slope[:, None] * (t0[:, None] + ahead[None, :])
+    predicted = np.where(mask, np.clip(per_day, 0, None), 0.0).sum(axis=1)
+
+    month = as_of.dt.to_period("M").dt.start_time
+    logged = months.reindex(pd.MultiIndex.from_arrays([stats.index, month], names=["user_id", "month"])).fillna(0.0)
+    out = pd.DataFrame({
+        "as_of": as_of,
+        "month": month,
+        "days_remaining": remaining,
+        "slope_kwh_per_day": slope,
+        "kwh_to_date": logged["kwh"].to_numpy(),
+        "kwh_predicted": predicted,
+    }, index=stats.index)
+    out["kwh_projected"] = out["kwh_to_date"] + out["kwh_predicted"]
+    out["cost_rs_projected"] = logged["cost_rs"].to_numpy() + predicted * latest["tariff_rs_per_kwh"].fillna(0.0)
+    out["co2_kg_projected"] = logged["co2_kg"].to_numpy() + predicted * latest["emission_factor_kg_per_kwh"].fillna(0.0)
+    out["kwh_per_day_projected"] = out["kwh_projected"] / as_of.dt.days_in_month
+    return out
+
+
+class ForecastView:
+    """Sufficient statistics and month-end projections for every user."""
+
+    def __init__(self, df):
+        self.stats = sufficient_stats(df)
+        self.latest = latest_entries(df)
+        self.months = month_totals(df)
+        self.table = project(self.stats, self.latest, self.months)
+
+    def update(self, new_rows, df, removed):
+        part, gone = sufficient_stats(new_rows), sufficient_stats(removed)
+        if part.empty and gone.empty:
+            return
+        stats = self.stats.add(part, fill_value=0.0).sub(gone, fill_value=0.0)
+        stats = stats[stats[[f"n_{d}" for d in WEEKDAYS]].sum(axis=1) > 0]
+        # A user who lost an entry may have lost their latest one: look them up again
+        stale = gone.index
+        fresh = new_rows[~new_rows["user_id"].isin(stale)]
+        # Rows appended later win ties, so the existing table goes first.
+        candidates = [self.latest.drop(index=stale), latest_entries(fresh)]
+        if len(stale):
+            candidates.append(latest_entries(df[df["user_id"].isin(stale)]))
+        candidates = pd.concat(candidates)
+        latest = (candidates.reset_index().sort_values("as_of", kind="stable")
+                  .groupby("user_id").tail(1).set_index("user_id"))
+        months = self.months.add(month_totals(new_rows), fill_value=0.0).sub(month_totals(removed), fill_value=0.0)
+        affected = part.index.union(gone.index)
+        refit = project(stats.loc[stats.index.intersection(affected)], latest, months)
+        self.stats, self.latest, self.months = stats, latest, months
+        self.table = pd.concat([self.table.drop(index=affected, errors="ignore"), refit])
+
+    def for_user(self, user_id):
+        """The projection row for one user, or None if they have no entries."""
+        user_id = str(user_id)
+        return self.table.loc[user_id] if user_id in self.table.index else None
+
+
+register_view("forecast", ForecastView)
+
+
+def get_forecasts():
+    """The shared, up-to-date ForecastView for the current log."""
+    return get_view("forecast")
@@ -0,0 +1,128 @@
+"""Baseline-vs-post campaign impact, paired by user, with bootstrap intervals.
+
+Each participant with both baseline and post logs contributes one paired
+difference (post mean per logged day minus baseline mean) of kWh, cost and
+CO₂, and a 0/1 for having adopted at least one habit. The cohort figures
+are means of those per-user values; their confidence intervals come from a
+percentile bootstrap over users.
+
+Resampling is vectorized: a batch of resamples is drawn as multinomial
+counts (how often each user is picked), and all the batch's means are one
+matrix product of those counts with the per-user values. Batches can be
+spread over worker processes; results depend only on the seed, not on the
+number of workers.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, USAGE_COLUMNS
+from rollups import get_rollups
+from whatif import get_usage_totals
+
+ADOPTION_DROP = 0.10     # post usage at least 10% below baseline counts as a new habit
+N_RESAMPLES = 10_000
+CONFIDENCE = 0.95
+BATCH_RESAMPLES = 500    # resamples per batch (and per task when using workers)
+
+METRICS = {
+    "kwh": "Δ kWh per day",
+    "cost_rs": "Δ ₹ per day",
+    "co2_kg": "Δ kg CO₂ per day",
+    "adopted": "% adopting at least 1 habit",
+}
+
+
+def habit_table(totals):
+    """Per user and appliance: True where mean post usage is ADOPTION_DROP below baseline.
+
+    ``totals`` is a usage-totals table per (user, period) (see whatif.usage_totals).
+    """
+    columns = [a.column for a in APPLIANCES]
+    periods = totals.index.get_level_values("period")
+    if not {"baseline", "post"} <= set(periods):
+        return pd.DataFrame(columns=columns, dtype=bool)
+    sums = totals[[f"{c}_sum" for c in USAGE_COLUMNS]].set_axis(USAGE_COLUMNS, axis=1)
+    means = sums.div(totals["rows_count"], axis=0)[columns]
+    baseline = means.xs("baseline", level="period")
+    post = means.xs("post", level="period")
+    baseline, post = baseline.align(post, join="inner")
+    habits = (post <= baseline * (1 - ADOPTION_DROP)) & (baseline > 0)
+    habits.index = habits.index.astype(str)
+    return habits
+
+
+def paired_deltas(per_user_period, habits):
+    """One row per user with baseline and post logs: post − baseline mean of
+    each metric, the number of habits and whether at least one was adopted."""
+    out = pd.DataFrame()
+    for metric in ("kwh", "cost_rs", "co2_kg"):
+        means = per_user_period[f"{metric}_mean"].unstack("period")
+        if not {"baseline", "post"} <= set(means.columns):
+            return pd.DataFrame(columns=["kwh", "cost_rs", "co2_kg", "habits", "adopted"])
+        out[metric] = means["post"] - means["baseline"]
+    out = out.dropna()
+    out.index = out.index.astype(str)
+    out["habits"] = habits.sum(axis=1).reindex(out.index).fillna(0).astype(int)
+    out["adopted"] = out["habits"] > 0
+    return out
+
+
+def _resample_means(values, n_resamples, seed):
+    """Means of ``n_resamples`` bootstrap resamples of the rows of ``values``."""
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    out = np.empty((n_resamples, values.shape[1]))
+    for i in range(0, n_resamples, BATCH_RESAMPLES):
+        size = min(BATCH_RESAMPLES, n_resamples - i)
+        counts = rng.multinomial(n, np.full(n, 1.0 / n), size=size)
+        out[i:i + size] = counts @ values / n
+    return out
+
+
+def bootstrap_ci(values, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0, workers=None):
+    """Percentile bootstrap interval for the mean of each column of ``values``.
+
+    Returns (low, high) arrays. ``workers`` > 1 spreads the resamples over
+    that many processes.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if len(values) < 2:
+        nan = np.full(values.shape[1], np.nan)
+        return nan, nan
+    tasks = [min(BATCH_RESAMPLES, n_resamples - i) for i in range(0, n_resamples, BATCH_RESAMPLES)]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_resample_means, [values] * len(tasks), tasks, seeds))
+    else:
+        parts = [_resample_means(values, size, s) for size, s in zip(tasks, seeds)]
+    means = np.vstack(parts)
+    alpha = (1 - confidence) / 2
+    return np.quantile(means, alpha, axis=0), np.quantile(means, 1 - alpha, axis=0)
+
+
+def impact_summary(deltas, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0, workers=None):
+    """Cohort estimate and bootstrap interval of each metric in METRICS."""
+    values = deltas[list(METRICS)].astype(float).to_numpy()
+    low, high = bootstrap_ci(values, n_resamples, confidence, seed, workers)
+    out = pd.DataFrame({
+        "metric": list(METRICS.values()),
+        "estimate": values.mean(axis=0) if len(values) else np.nan,
+        "ci_low": low,
+        "ci_high": high,
+    })
+    adopted = out["metric"] == METRICS["adopted"]
+    out.loc[adopted, ["estimate", "ci_low", "ci_high"]] *= 100
+    out["users"] = len(values)
+    return out
+
+
+def cohort_impact(n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0, workers=None):
+    """(per-user paired deltas, impact summary) for the current log."""
+    habits = habit_table(get_usage_totals().table)
+    deltas = paired_deltas(get_rollups().summary("user_period"), habits)
+    return deltas, impact_summary(deltas, n_resamples, confidence, seed, workers)
@@ -0,0 +1,167 @@
+"""Bulk import of Google Forms / campaign CSV exports into the energy log.
+
+Usage:
+    python importer.py responses.csv [--period post] [--tariff 7.5] [--chunksize 200000]
+
+The export is read in chunks; each chunk has its columns mapped onto
+utils.HEADERS, is validated, de-duplicated on (user_id, date, period) and
+has kWh, cost and CO₂ computed in one vectorized pass. All accepted rows
+are appended to the log in a single transaction.
+"""
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, DEFAULT_EMISSION, DEFAULT_TARIFF, compute_energy
+from utils import HEADERS, append_log_batches, key_hashes, read_logs
+
+CHUNKSIZE = 200_000
+MAX_HOURS_PER_DAY = 24
+
+PERIODS = ["baseline", "post", "daily", "weekly"]
+
+
+def normalize_name(name):
+    """'Fan hours (per day)' -> 'fan_hours_per_day'."""
+    return re.sub(r"[^0-9a-z]+", "_", str(name).strip().lower()).strip("_")
+
+
+# Normalized export header -> log column. Exact HEADERS names always match.
+COLUMN_ALIASES = {
+    "user": "user_id",
+    "userid": "user_id",
+    "user_id_e_g_user01": "user_id",
+    "participant": "user_id",
+    "participant_id": "user_id",
+    "day": "date",
+    "log_date": "date",
+    "period_label": "period",
+    "phase": "period",
+    "tariff": "tariff_rs_per_kwh",
+    "tariff_rs_per_kwh": "tariff_rs_per_kwh",
+    "emission_factor": "emission_factor_kg_per_kwh",
+}
+for _a in APPLIANCES:
+    _unit = "hours" if _a.unit == "hours" else "cycles"
+    for _name in (_a.name, _a.label):
+        COLUMN_ALIASES[f"{normalize_name(_name)}_{_unit}"] = _a.column
+        COLUMN_ALIASES[f"{normalize_name(_name)}_{_unit}_per_day"] = _a.column
+COLUMN_ALIASES["washing_cycles_per_day"] = "washing_cycles"
+
+# Used only when the export has no better column for the field.
+FALLBACK_ALIASES = {
+    "email_address": "user_id",
+    "username": "user_id",
+    "timestamp": "date",
+}
+
+
+def map_columns(columns):
+    """{export column: log column} for the columns of a response export."""
+    mapping = {}
+    taken = set()
+    for aliases in (dict(zip(HEADERS, HEADERS)) | COLUMN_ALIASES, FALLBACK_ALIASES):
+        for col in columns:
+            target = aliases.get(normalize_name(col))
+            if target and target not in taken and col not in mapping:
+                mapping[col] = target
+                taken.add(target)
+    return mapping
+
+
+def prepare_chunk(chunk, mapping, default_period, tariff, emission_factor, wattages=None):
+    """Map, validate and price one chunk.
+
+    Returns (valid rows in HEADERS layout with datetime dates, invalid count).
+    """
+    df = chunk[list(mapping)].rename(columns=mapping)
+
+    user = df["user_id"].astype("string").str.strip() if "user_id" in df else pd.Series(pd.NA, index=df.index, dtype="string")
+    dates = pd.to_datetime(df["date"], errors="coerce").dt.normalize() if "date" in df else pd.Series(pd.NaT, index=df.index)
+    if "period" in df:
+        period = df["period"].astype("string").str.strip().str.lower().replace("", pd.NA).fillna(default_period)
+    else:
+        period = pd.Series(default_period, index=df.index, dtype="string")
+
+    valid = user.notna() & (user != "") & dates.notna()
+    out = pd.DataFrame({"user_id": user, "date": dates, "period": period})
+    for a in APPLIANCES:
+        usage = pd.to_numeric(df[a.column], errors="coerce").fillna(0) if a.column in df else pd.Series(0.0, index=df.index)
+        valid &= usage >= 0
+        if a.unit == "hours":
+            valid &= usage <= MAX_HOURS_PER_DAY
+        else:
+            usage = usage.round().astype("int64")
+        out[a.column] = usage
+
+    for col, default in (("tariff_rs_per_kwh", tariff), ("emission_factor_kg_per_kwh", emission_factor)):
+        values = pd.to_numeric(df[col], errors="coerce") if col in df else pd.Series(np.nan, index=df.index)
+        out[col] = values.fillna(default)
+
+    out["kwh"] = compute_energy(out, wattages)["kwh"].round(3)
+    out["cost_rs"] = (out["kwh"] * out["tariff_rs_per_kwh"]).round(2)
+    out["co2_kg"] = (out["kwh"] * out["emission_factor_kg_per_kwh"]).round(3)
+    return out.loc[valid.to_numpy(), HEADERS], int((~valid).sum())
+
+
+def import_responses(source, period="daily", tariff=DEFAULT_TARIFF, emission_factor=DEFAULT_EMISSION,
+                     wattages=None, chunksize=CHUNKSIZE):
+    """Import a response export (path or file object) into the log.
+
+    Rows whose (user_id, date, period) already exists in the log, or that
+    repeat an earlier row of the same export, are skipped. Returns a dict
+    with the counts read / imported / invalid / duplicates.
+    """
+    stats = {"read": 0, "imported": 0, "invalid": 0, "duplicates": 0}
+
+    # Map the header first so numeric columns can be parsed natively by
+    # read_csv while ids and labels stay text.
+    header = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, "seek"):
+        source.seek(0)
+    mapping = map_columns(header)
+    missing = {"user_id", "date"} - set(mapping.values())
+    if missing:
+        raise ValueError(f"Export has no column for {sorted(missing)}; columns: {list(header)}")
+    text_columns = {col: str for col, target in mapping.items() if target in ("user_id", "date", "period")}
+
+    existing = read_logs(columns=["user_id", "date", "period"]).dropna()
+    seen = [key_hashes(existing["user_id"], existing["date"], existing["period"])]
+
+    def batches():
+        for chunk in pd.read_csv(source, chunksize=chunksize, usecols=list(mapping), dtype=text_columns):
+            stats["read"] += len(chunk)
+            rows, invalid = prepare_chunk(chunk, mapping, period, tariff, emission_factor, wattages)
+            stats["invalid"] += invalid
+
+            hashes = key_hashes(rows["user_id"], rows["date"], rows["period"])
+            fresh = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, np.concatenate(seen))
+            stats["duplicates"] += int((~fresh).sum())
+            seen.append(hashes[fresh])
+            stats["imported"] += int(fresh.sum())
+            rows = rows[fresh]
+            yield rows.assign(date=rows["date"].dt.strftime("%Y-%m-%d"))
+
+    append_log_batches(batches())
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import a Google Forms / campaign CSV export into the energy log.")
+    parser.add_argument("source", help="CSV export to import")
+    parser.add_argument("--period", default="daily", choices=PERIODS, help="period label for rows without one")
+    parser.add_argument("--tariff", type=float, default=DEFAULT_TARIFF, help="Rs per kWh for rows without one")
+    parser.add_argument("--emission", type=float, default=DEFAULT_EMISSION, help="kg CO2 per kWh for rows without one")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows read per chunk")
+    args = parser.parse_args(argv)
+
+    stats = import_responses(args.source, period=args.period, tariff=args.tariff,
+                             emission_factor=args.emission, chunksize=args.chunksize)
+    print(f"read {stats['read']}, imported {stats['imported']}, "
+          f"invalid {stats['invalid']}, duplicates {stats['duplicates']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Community leaderboards: per-user kWh rank and percentile for a window.
+
+A user's score in a window (a calendar week, a calendar month, or the whole
+campaign) is their mean kWh per logged entry; lower ranks higher. The view
+keeps kWh sums and entry counts per (window bucket, user), merged as rows
+are appended and subtracted as they are replaced or deleted. The first
+query of a bucket sorts its users into a Board; after that, changed rows
+move only their own users within the board with bisect, so rank, percentile, top-N and neighbour queries are O(log users)
+lookups plus the size of the answer.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+
+from rollups import merge
+from utils import get_view, register_view
+
+WINDOWS = {
+    "week": "Calendar week",
+    "month": "Calendar month",
+    "campaign": "Whole campaign",
+}
+CAMPAIGN = pd.Timestamp(0)   # the single bucket of the "campaign" window
+
+
+def window_buckets(dates, window):
+    """The bucket (start of week/month, or CAMPAIGN) of each date."""
+    if window == "week":
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    if window == "month":
+        return dates.dt.to_period("M").dt.start_time
+    if window == "campaign":
+        return pd.Series(CAMPAIGN, index=dates.index)
+    raise ValueError(f"Unknown window {window!r}; expected one of {sorted(WINDOWS)}")
+
+
+def bucket_of(date, window):
+    """The bucket of ``window`` containing one date."""
+    return window_buckets(pd.Series([pd.Timestamp(date)]), window).iloc[0]
+
+
+def window_totals(df, window):
+    """kwh_sum and kwh_count per (bucket, user_id) for one window."""
+    rows = df[df["user_id"].notna() & df["date"].notna() & df["kwh"].notna()]
+    if rows.empty:
+        return pd.DataFrame(columns=["kwh_sum", "kwh_count"],
+                            index=pd.MultiIndex.from_arrays([[], []], names=["bucket", "user_id"]))
+    keys = pd.DataFrame({"bucket": window_buckets(rows["date"], window),
+                         "user_id": rows["user_id"].astype(str)})
+    kwh = keys.join(rows["kwh"].astype("float64"))
+    out = kwh.groupby(["bucket", "user_id"])["kwh"].agg(["sum", "count"])
+    return out.rename(columns={"sum": "kwh_sum", "count": "kwh_count"})
+
+
+class Board:
+    """Users of one window bucket sorted by score (mean kWh per entry)."""
+
+    def __init__(self, totals):
+        # totals: DataFrame of kwh_sum/kwh_count indexed by user_id
+        self.totals = {u: (s, int(n)) for u, s, n in zip(totals.index, totals["kwh_sum"], totals["kwh_count"])}
+        self.keys = sorted((s / n, u) for u, (s, n) in self.totals.items())
+        self.scores = [k[0] for k in self.keys]
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.totals, board.keys, board.scores = dict(self.totals), list(self.keys), list(self.scores)
+        return board
+
+    def add(self, user_id, kwh_sum, count):
+        """Add a user's new entries (negative sums and counts take removed
+        ones away), moving them to their new place."""
+        if user_id in self.totals:
+            s, n = self.totals.pop(user_id)
+            i = bisect_left(self.keys, (s / n, user_id))
+            del self.keys[i], self.scores[i]
+            kwh_sum, count = kwh_sum + s, count + n
+        if count <= 0:
+            return
+        self.totals[user_id] = (kwh_sum, count)
+        key = (kwh_sum / count, user_id)
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.scores.insert(i, key[0])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def score(self, user_id):
+        if user_id not in self.totals:
+            return None
+        s, n = self.totals[user_id]
+        return s / n
+
+    def rank(self, user_id):
+        """1-based rank (ties share the best rank), or None if the user has no entries."""
+        score = self.score(user_id)
+        return None if score is None else bisect_left(self.scores, score) + 1
+
+    def percentile(self, user_id):
+        """Share (0–100) of the other users with a higher score; ties count half."""
+        score = self.score(user_id)
+        if score is None:
+            return None
+        if len(self) == 1:
+            return 100.0
+        lower, upper = bisect_left(self.scores, score), bisect_right(self.scores, score)
+        higher, ties = len(self) - upper, upper - lower - 1
+        return 100.0 * (higher + ties / 2) / (len(self) - 1)
+
+    def _rows(self, start, stop):
+        return pd.DataFrame(
+            [(bisect_left(self.scores, s) + 1, u, s, self.totals[u][1]) for s, u in self.keys[start:stop]],
+            columns=["rank", "user_id", "kwh_mean", "entries"],
+        )
+
+    def top(self, n=10):
+        """The ``n`` best-ranked users."""
+        return self._rows(0, n)
+
+    def around(self, user_id, k=2):
+        """The user and up to ``k`` users ranked either side of them."""
+        score = self.score(user_id)
+        if score is None:
+            return self._rows(0, 0)
+        i = bisect_left(self.keys, (score, user_id))
+        return self._rows(max(0, i - k), i + k + 1)
+
+
+class Leaderboard:
+    """Window totals for every window, and the Boards queried so far."""
+
+    def __init__(self, df):
+        self.totals = {window: window_totals(df, window) for window in WINDOWS}
+        self.boards = {}
+        # Boards are built on first query, outside the log cache's lock; this
+        # keeps a build from racing an update and publishing stale totals.
+        self._lock = threading.Lock()
+
+    def update(self, new_rows, df, removed):
+        with self._lock:
+            self._update(new_rows, removed)
+
+    def _update(self, new_rows, removed):
+        parts = {window: window_totals(new_rows, window) for window in WINDOWS}
+        if not removed.empty:
+            parts = {window: merge(part, -window_totals(removed, window)) for window, part in parts.items()}
+        boards = dict(self.boards)
+        for (window, bucket), board in self.boards.items():
+            part = parts[window]
+            if bucket not in part.index.get_level_values("bucket"):
+                continue
+            board = board.copy()
+            for user_id, row in part.xs(bucket, level="bucket").iterrows():
+                board.add(user_id, row["kwh_sum"], int(row["kwh_count"]))
+            boards[(window, bucket)] = board
+        totals = {window: merge(self.totals[window], parts[window]) for window in WINDOWS}
+        self.totals = {window: t[t["kwh_count"] > 0] for window, t in totals.items()}
+        self.boards = boards
+
+    def buckets(self, window):
+        """The window's buckets present in the log, latest first."""
+        return sorted(self.totals[window].index.get_level_values("bucket").unique(), reverse=True)
+
+    def board(self, window, bucket=None):
+        """The Board for a bucket of ``window`` (default: the latest one)."""
+        if bucket is None:
+            buckets = self.buckets(window)
+            if not buckets:
+                return Board(pd.DataFrame(columns=["kwh_sum", "kwh_count"]))
+            bucket = buckets[0]
+        bucket = pd.Timestamp(bucket)
+        key = (window, bucket)
+        with self._lock:
+            if key not in self.boards:
+                totals = self.totals[window]
+                if bucket in totals.index.get_level_values("bucket"):
+                    totals = totals.xs(bucket, level="bucket")
+                else:
+                    totals = totals.iloc[:0].droplevel("bucket")
+                self.boards = {**self.boards, key: Board(totals)}
+            return self.boards[key]
+
+
+register_view("leaderboard", Leaderboard)
+
+
+def get_leaderboard():
+    """The shared, up-to-date Leaderboard for the current log."""
+    return get_view("leaderboard")
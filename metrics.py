@@ -0,0 +1,103 @@
+"""Timers and counters for the app's hot paths.
+
+Each process keeps running totals in memory (see snapshot()). Every timed
+stage is also appended as one JSON line to METRICS_FILE, so a slow rerun
+under real load can be traced afterwards without a profiler. Set
+ENERGY_METRICS=0 to stop writing the file; the in-memory totals are always
+kept.
+
+    with timer("analytics.load") as t:
+        df = read_logs()
+        t["rows"] = len(df)      # extra fields go into the JSON line
+    count("cache.hit")
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_FILE = os.environ.get("ENERGY_METRICS_FILE", os.path.join(tempfile.gettempdir(), "energy_metrics.jsonl"))
+WRITE_FILE = os.environ.get("ENERGY_METRICS", "1") != "0"
+MAX_FILE_BYTES = 10 * 2**20   # then rotated to METRICS_FILE + ".1"
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timers = {}
+
+
+def count(name, n=1):
+    """Add ``n`` to the counter ``name``."""
+    with _lock:
+        _counters[name] += n
+
+
+def _write(record):
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        try:
+            if os.path.exists(METRICS_FILE) and os.path.getsize(METRICS_FILE) > MAX_FILE_BYTES:
+                os.replace(METRICS_FILE, METRICS_FILE + ".1")
+            with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:  # metrics must never break a page
+            pass
+
+
+@contextmanager
+def timer(name, **fields):
+    """Time the block as stage ``name``. Yields a dict for extra fields (row counts etc.)."""
+    info = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(name, (time.perf_counter() - start) * 1000, **info)
+
+
+def record(name, ms, **fields):
+    """Record a duration measured elsewhere as one run of stage ``name``."""
+    with _lock:
+        stats = _timers.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
+        stats["last_ms"] = ms
+    if WRITE_FILE:
+        _write({"ts": round(time.time(), 3), "pid": os.getpid(), "stage": name, "ms": round(ms, 3), **fields})
+
+
+def snapshot():
+    """This process's totals: {"timers": {name: stats}, "counters": {name: value}}."""
+    with _lock:
+        return {
+            "timers": {name: dict(stats) for name, stats in _timers.items()},
+            "counters": dict(_counters),
+        }
+
+
+def reset():
+    """Clear the in-memory totals (the metrics file is left alone)."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def read_recent(limit=1000):
+    """The last ``limit`` records of METRICS_FILE, oldest first, from every process."""
+    try:
+        with open(METRICS_FILE, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - limit * 300))  # records are well under 300 bytes
+            lines = f.read().splitlines()[-limit:]
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:  # partial first line after the seek
+            pass
+    return records
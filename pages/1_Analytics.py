@@ -2,41 +2,120 @@
 # pages/1_Analytics.py
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from utils import read_logs
+from downsample import MAX_USER_LINES, resample_series
+from energy import APPLIANCES, USAGE_COLUMNS
+from impact import cohort_impact
+from leaderboard import WINDOWS, get_leaderboard
+from metrics import timer
+from startup import page_finished, page_started
+from rollups import get_rollups
+from utils import log_version, read_logs
 
+page_started("analytics")
 st.title("Energy Usage Analytics")
 
-df = read_logs()
+with timer("analytics.load") as t:
+    df = read_logs()
+    rollups = get_rollups()
+    t["rows"] = len(df)
 if df.empty:
     st.warning("No data available. Please add logs first.")
     st.stop()
 
 # Aggregate View
 st.header("Overall Energy Trends")
-fig = px.line(df, x="date", y="kwh", color="user_id", markers=True,
-              title="Energy Consumption Over Time")
-st.plotly_chart(fig, use_container_width=True)
+first_day, last_day = df["date"].min().date(), df["date"].max().date()
+date_range = st.date_input("Date range", value=(first_day, last_day), min_value=first_day, max_value=last_day)
+if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+    start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+else:  # still picking the end date
+    start, end = pd.Timestamp(first_day), pd.Timestamp(last_day)
+with timer("analytics.aggregate", section="trend") as t:
+    in_range = df[(df["date"] >= start) & (df["date"] <= end)]
+    # Bucketed to a bounded number of points for the selected range; with
+    # many users, one cohort-average line (as on the home page)
+    many_users = in_range["user_id"].nunique() > MAX_USER_LINES
+    if many_users:
+        trend, bucket = resample_series(in_range.groupby("date", as_index=False)["kwh"].mean())
+        trend = trend.assign(user_id="All users (average)")
+    else:
+        trend, bucket = resample_series(in_range, by="user_id")
+    t["points"] = len(trend)
+with timer("analytics.chart", section="trend"):
+    import plotly.express as px  # deferred until a chart is drawn (see startup.py)
+    fig = px.line(trend, x="date", y="kwh", color="user_id", markers=True,
+                  title="Energy Consumption Over Time")
+    st.plotly_chart(fig, use_container_width=True)
+if many_users:
+    st.caption(f"{in_range['user_id'].nunique()} users in range, shown as one average line.")
+if bucket != "raw":
+    st.caption(f"Showing average kWh per {bucket}; narrow the date range for more detail.")
 
 # Baseline vs Post
 st.header("⚖ Baseline vs Post Comparison")
-if "baseline" in df["period"].values and "post" in df["period"].values:
-    compare = df.groupby("period")[["kwh", "cost_rs", "co2_kg"]].mean().reset_index()
-    fig2 = px.bar(compare.melt(id_vars="period", var_name="Metric", value_name="Value"),
-                  x="Metric", y="Value", color="period", barmode="group", text_auto=".2f")
-    st.plotly_chart(fig2, use_container_width=True)
+with timer("analytics.aggregate", section="periods"):
+    by_period = rollups.summary("period")
+if {"baseline", "post"} <= set(by_period.index):
+    compare = (by_period[["kwh_mean", "cost_rs_mean", "co2_kg_mean"]]
+               .rename(columns=lambda c: c[:-len("_mean")]).reset_index())
+    with timer("analytics.chart", section="periods"):
+        fig2 = px.bar(compare.melt(id_vars="period", var_name="Metric", value_name="Value"),
+                      x="Metric", y="Value", color="period", barmode="group", text_auto=".2f")
+        st.plotly_chart(fig2, use_container_width=True)
 else:
     st.info("Need both baseline and post data to show comparison.")
 
+
+@st.cache_data(max_entries=4, show_spinner="Bootstrapping confidence intervals…")
+def _impact(version):
+    # version only keys the cache; the log itself comes from the shared views
+    return cohort_impact()
+
+
+# Paired per-user impact
+st.header("Campaign Impact (paired by user)")
+with timer("analytics.aggregate", section="impact") as t:
+    deltas, impact = _impact(log_version())
+    t["users"] = len(deltas)
+if deltas.empty:
+    st.info("Need users with both baseline and post logs to estimate impact.")
+else:
+    st.caption(f"{len(deltas)} users with baseline and post logs. Δ is post minus baseline "
+               "(negative = saving); intervals are 95% bootstrap intervals over users.")
+    cols = st.columns(len(impact))
+    for col, row in zip(cols, impact.itertuples()):
+        col.metric(row.metric, f"{row.estimate:,.2f}", help=f"95% CI {row.ci_low:,.2f} to {row.ci_high:,.2f}")
+    st.dataframe(impact.set_index("metric").round(3), use_container_width=True)
+    with timer("analytics.chart", section="impact"):
+        fig_impact = px.histogram(deltas, x="kwh", nbins=40, title="Per-user change in kWh per day")
+        st.plotly_chart(fig_impact, use_container_width=True)
+
 # Appliance Breakdown
 st.header("Appliance Usage Breakdown")
-appliance_cols = ["fan_hours", "light_hours", "ac_hours", "charger_hours", "washing_cycles"]
-avg_usage = df.groupby("period")[appliance_cols].mean().reset_index()
-fig3 = px.bar(avg_usage.melt(id_vars="period", var_name="Appliance", value_name="Hours"),
-              x="Appliance", y="Hours", color="period", barmode="group", text_auto=".2f")
-st.plotly_chart(fig3, use_container_width=True)
+# Hours and cycles share one axis, so each bar's unit is in its label
+appliance_labels = {a.column: f"{a.label} ({a.unit})" for a in APPLIANCES}
+with timer("analytics.aggregate", section="appliances"):
+    avg_usage = (df.groupby("period", observed=True)[USAGE_COLUMNS].mean()
+                 .rename(columns=appliance_labels).reset_index())
+with timer("analytics.chart", section="appliances"):
+    fig3 = px.bar(avg_usage.melt(id_vars="period", var_name="Appliance", value_name="Average per entry"),
+                  x="Appliance", y="Average per entry", color="period", barmode="group", text_auto=".2f")
+    st.plotly_chart(fig3, use_container_width=True)
 
 # Top Energy Savers
 st.header("Top Energy Savers")
-savings = df.groupby("user_id")["kwh"].sum().sort_values()
-st.bar_chart(savings)
+leaderboard = get_leaderboard()
+s1, s2 = st.columns(2)
+with s1:
+    savers_window = st.selectbox("Window", options=list(WINDOWS), format_func=WINDOWS.get, index=2)
+with s2:
+    buckets = leaderboard.buckets(savers_window)
+    savers_bucket = st.selectbox("Starting", options=buckets, disabled=savers_window == "campaign",
+                                 format_func=lambda b: "All dates" if savers_window == "campaign" else f"{b:%Y-%m-%d}")
+with timer("analytics.aggregate", section="savers"):
+    top = leaderboard.board(savers_window, savers_bucket).top(10)
+st.caption("Lowest average kWh per logged entry in the window.")
+with timer("analytics.chart", section="savers"):
+    st.bar_chart(top.set_index("user_id")["kwh_mean"])
+
+page_finished()
@@ -1,29 +1,37 @@
 # pages/2_User_Profile.py
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 import os
 import datetime
 import random
 
-from utils import LOG_FILE, read_logs
-
+from anomalies import describe, get_anomalies
+from downsample import resample_series
+from forecast import get_forecasts
+from leaderboard import WINDOWS, bucket_of, get_leaderboard
+from metrics import timer
+from startup import page_finished, page_started
+from rollups import get_rollups
+from streaks import get_streaks
+from utils import list_users, read_logs
+
+page_started("profile")
 st.title("User Profile Dashboard")
 
-# Load logs
-df = read_logs()
+users = list_users()
 
-if df.empty:
+if not users:
     st.warning("⚠ No user data found. Please add some logs first.")
     st.stop()
 
 # ---------------------------
 # User Selector
 # ---------------------------
-users = df["user_id"].unique().tolist()
 selected_user = st.selectbox("Select a user", users)
 
-user_df = df[df["user_id"] == selected_user].sort_values("date")
+# Only the selected user's rows are loaded
+with timer("profile.load") as t:
+    user_df = read_logs(user_id=selected_user).sort_values("date")
+    t["rows"] = len(user_df)
 
 # ---------------------------
 # Profile Card
@@ -50,8 +58,28 @@ with col2:
 # Trend Snapshot
 # ---------------------------
 st.subheader("Usage Snapshot")
-fig = px.line(user_df, x="date", y="kwh", markers=True, title="Daily Energy Usage")
-st.plotly_chart(fig, use_container_width=True)
+with timer("profile.aggregate", section="trend"):
+    trend, bucket = resample_series(user_df)
+with timer("profile.chart", section="trend"):
+    import plotly.express as px  # deferred until a chart is drawn (see startup.py)
+    fig = px.line(trend, x="date", y="kwh", markers=True,
+                  title="Daily Energy Usage" if bucket == "raw" else f"Energy Usage (average per {bucket})")
+    st.plotly_chart(fig, use_container_width=True)
+
+# ---------------------------
+# Unusual Days
+# ---------------------------
+st.subheader("Unusual Days")
+# Flagged against the user's own recent average (anomalies.py)
+with timer("profile.aggregate", section="anomalies"):
+    user_alerts = get_anomalies().for_user(selected_user, limit=10)
+if user_alerts.empty:
+    st.success("No unusually high usage days so far.")
+else:
+    for _, alert in user_alerts.head(3).iterrows():
+        st.warning(describe(alert))
+    with st.expander(f"Last {len(user_alerts)} alerts"):
+        st.dataframe(user_alerts.drop(columns="user_id").round({"value": 2, "expected": 2, "z": 1}), hide_index=True, use_container_width=True)
 
 # ---------------------------
 # Goals & Progress
@@ -65,6 +93,24 @@ if latest_usage <= goal:
 else:
     st.warning(f"You used {latest_usage:.2f} kWh, above your goal of {goal} kWh.")
 
+# Month-end projection from this user's fitted trend (forecast.py)
+with timer("profile.aggregate", section="forecast"):
+    projection = get_forecasts().for_user(selected_user)
+if projection is not None:
+    month_label = f"{projection['month']:%B %Y}"
+    st.markdown(f"**Projected for {month_label}** (as of {projection['as_of']:%d %b}, "
+                f"{projection['days_remaining']} days to go)")
+    p1, p2, p3 = st.columns(3)
+    p1.metric("kWh", f"{projection['kwh_projected']:.1f}", help=f"{projection['kwh_to_date']:.1f} kWh logged so far")
+    p2.metric("Cost", f"₹ {projection['cost_rs_projected']:.0f}")
+    p3.metric("CO₂", f"{projection['co2_kg_projected']:.1f} kg")
+    if projection["kwh_per_day_projected"] <= goal:
+        st.success(f"At this pace you will average {projection['kwh_per_day_projected']:.2f} kWh/day in "
+                   f"{month_label}, within your goal.")
+    else:
+        st.info(f"At this pace you will average {projection['kwh_per_day_projected']:.2f} kWh/day in "
+                f"{month_label}, {projection['kwh_per_day_projected'] - goal:.2f} above your goal.")
+
 # -------------------------
 # Achievements
 # -------------------------
@@ -72,13 +118,13 @@ st.subheader("Achievements")
 
 achievements = []
 
-if "date" in user_df.columns:
-    # Ensure date is datetime
-    user_df["date"] = pd.to_datetime(user_df["date"], errors="coerce")
-    user_df["date"].fillna(pd.Timestamp.today().normalize(), inplace=True)
+# Active days and streaks come precomputed for every user (streaks.py)
+with timer("profile.aggregate", section="streaks"):
+    user_streak = get_streaks().for_user(selected_user)
 
+if user_streak is not None:
     # Active days
-    active_days = user_df["date"].dt.normalize().nunique()
+    active_days = user_streak["active_days"]
     if active_days >= 7:
         achievements.append("Weekly Warrior – Logged 7+ active days")
     if active_days >= 30:
@@ -101,15 +147,8 @@ if "co2_kg" in user_df.columns:
         achievements.append("Climate Contributor – Tracked 100+ kg CO₂")
 
 # Consistency
-if "date" in user_df.columns:
-    dates_sorted = sorted(user_df["date"].dt.normalize().unique())
-    streak, max_streak = 1, 1
-    for i in range(1, len(dates_sorted)):
-        if (dates_sorted[i] - dates_sorted[i-1]) == pd.Timedelta(days=1):
-            streak += 1
-            max_streak = max(max_streak, streak)
-        else:
-            streak = 1
+if user_streak is not None:
+    max_streak = user_streak["max_streak"]
     if max_streak >= 5:
         achievements.append(f"Consistency Champ – {max_streak}-day streak")
 
@@ -125,8 +164,21 @@ else:
 # Community Comparison
 # ---------------------------
 st.subheader("Community Rank")
-community_avg = df["kwh"].mean()
+rank_window = st.radio("Compare over", options=list(WINDOWS), format_func=WINDOWS.get, horizontal=True)
+with timer("profile.aggregate", section="community"):
+    community_avg = get_rollups().overall()["kwh_mean"]
+    # The window that contains this user's latest entry
+    board = get_leaderboard().board(rank_window, bucket_of(user_df["date"].max(), rank_window))
+    rank, percentile = board.rank(selected_user), board.percentile(selected_user)
+if rank is not None:
+    r1, r2, r3 = st.columns(3)
+    r1.metric("Rank", f"{rank} of {len(board)}", help="By average kWh per entry; lower usage ranks higher")
+    r2.metric("Percentile", f"{percentile:.0f}%", help="Share of other users who use more energy per entry")
+    r3.metric("Your avg. kWh/entry", f"{board.score(selected_user):.2f}")
+    st.dataframe(board.around(selected_user, 2).set_index("rank").round(2), use_container_width=True)
 if avg_kwh < community_avg:
     st.success(f"You use less energy ({avg_kwh:.2f}) than the community average ({community_avg:.2f})!")
 else:
     st.error(f"You use more ({avg_kwh:.2f}) than the community average ({community_avg:.2f}). Try to reduce it!")
+
+page_finished()
@@ -1,18 +1,22 @@
 # pages/3_Tips_And_Recommendations.py
 import streamlit as st
-import pandas as pd
-from utils import read_logs
+from anomalies import describe, get_anomalies
+from metrics import timer
+from startup import page_finished, page_started
+from tips import cohort_summary, get_tips, tip_cards
+from utils import list_users
 
 st.set_page_config(page_title="Tips & Recommendations", layout="wide")
+page_started("tips")
 
 st.title("Smart Energy Tips & Recommendations")
 
 # -------------------------
 # Load Logs
 # -------------------------
-df = read_logs()
+users = list_users()
 
-if df is None or df.empty:
+if not users:
     st.warning("⚠ No data available. Please log entries first.")
     st.info("Meanwhile, here are some **general energy-saving tips**:")
     for tip in [
@@ -28,65 +32,26 @@ if df is None or df.empty:
 # -------------------------
 # User Selection
 # -------------------------
-users = df["user_id"].dropna().unique().tolist()
 selected_user = st.selectbox("Select User", users)
 
-user_df = df[df["user_id"] == selected_user].sort_values("date")
-if user_df.empty:
+# Tips and scores are precomputed for every user from their latest row (tips.py)
+with timer("tips.load"):
+    tips_view = get_tips()
+user_tips = tips_view.for_user(selected_user)
+if user_tips is None:
     st.warning(f"No records found for {selected_user}.")
     st.stop()
 
-latest = user_df.iloc[-1].copy()
-
-# Ensure numeric
-for col in ["fan_hours","light_hours","ac_hours","charger_hours","washing_cycles",
-            "tariff_rs_per_kwh","emission_factor_kg_per_kwh"]:
-    latest[col] = pd.to_numeric(latest.get(col, 0), errors="coerce") or 0
-
-tariff = latest["tariff_rs_per_kwh"]
-emission_factor = latest["emission_factor_kg_per_kwh"]
-
 st.subheader(f" Personalized Tips for **{selected_user}**")
 
-# -------------------------
-# Generate Personalized Tips
-# -------------------------
-tips = []
-
-def add_tip(condition, title, description, saved, co2, color, icon):
-    if condition:
-        tips.append({
-            "title": title,
-            "description": description,
-            "impact": f"Save ~₹{saved:.1f}/month | Cut {co2:.1f} kg CO₂",
-            "color": color,
-            "icon": icon
-        })
-
-# Fan
-saved = (0.5 * 75 / 1000) * tariff * 30
-co2 = (0.5 * 75 / 1000) * emission_factor * 30
-add_tip(latest["fan_hours"] > 6, "Fan Overuse", "Try reducing fan usage by 30 min/day.", saved, co2, "#FFA726"," ")
+tips = tip_cards(user_tips)
 
-# Light
-saved = (1 * 40 / 1000) * tariff * 30
-co2 = (1 * 40 / 1000) * emission_factor * 30
-add_tip(latest["light_hours"] > 4, "Lights On Too Long", "Switch off lights 1h earlier or use LED bulbs.", saved, co2, "#29B6F6", " ")
-
-# AC
-saved = (1 * 1500 / 1000) * tariff * 30
-co2 = (1 * 1500 / 1000) * emission_factor * 30
-add_tip(latest["ac_hours"] > 2, "AC Overuse", "Set AC to 26°C and reduce by 1h/day.", saved, co2, "#EF5350", " ")
-
-# Charger
-saved = (1 * 5 / 1000) * tariff * 30
-co2 = (1 * 5 / 1000) * emission_factor * 30
-add_tip(latest["charger_hours"] > 2, "Chargers Plugged In", "Unplug chargers when not in use.", saved, co2, "#66BB6A", " ")
-
-# Washing Machine
-saved = (1 * 500 / 1000) * tariff * 4
-co2 = (1 * 500 / 1000) * emission_factor * 4
-add_tip(latest["washing_cycles"] > 1, "Frequent Washing", "Try reducing washing by 1 cycle/week.", saved, co2, "#AB47BC", " ")
+# Recent days well above this user's own usual usage
+recent_alerts = get_anomalies().for_user(selected_user, limit=3)
+if not recent_alerts.empty:
+    st.markdown("#### Unusual Usage")
+    for _, alert in recent_alerts.iterrows():
+        st.warning(describe(alert))
 
 # -------------------------
 # Display Tips in Boxes
@@ -111,10 +76,21 @@ else:
 # Gamification: Score
 # -------------------------
 st.subheader("Your Energy Efficiency Score")
-score = max(0, 100 - int(latest["fan_hours"]*2 + latest["ac_hours"]*5 + latest["light_hours"]))
+score = int(user_tips["score"])
 st.progress(score/100)
 st.write(f"Your score: **{score}/100** (higher = better!)")
 
+# -------------------------
+# Campaign-wide view
+# -------------------------
+with st.expander("Tips across all users"):
+    cohort = tips_view.table
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Users", len(cohort))
+    c2.metric("Average score", f"{cohort['score'].mean():.0f}/100")
+    c3.metric("Potential savings", f"₹ {cohort['saved_rs'].sum():,.0f}/month")
+    st.dataframe(cohort_summary(cohort).round(2), use_container_width=True)
+
 # -------------------------
 # General Tips
 # -------------------------
@@ -128,3 +104,5 @@ with st.expander("General Energy-Saving Tips"):
     ]
     for tip in general_tips:
         st.write(tip)
+
+page_finished()
@@ -2,23 +2,27 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import datetime
 import random
 
+from downsample import resample_series
+from metrics import timer
+from startup import page_finished, page_started
+from rollups import get_latest, get_rollups
+from streaks import get_streaks
 from utils import read_logs  # Always use shared utils
 
-@st.cache_data
 def load_logs():
+    # read_logs() is cached process-wide, typed, and refreshed when new rows are saved
     try:
-        df = read_logs()
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        return df
+        return read_logs()
     except Exception as e:
         st.error(f"Error loading logs: {e}")
         return pd.DataFrame()
 
-df = load_logs()
+page_started("streaks")
+with timer("streaks.load") as t:
+    df = load_logs()
+    t["rows"] = len(df)
 
 st.title("Streaks & Rewards Library")
 
@@ -31,54 +35,81 @@ if df.empty:
 # -------------------------
 st.header(" User Energy Heroes")
 
-users = df["user_id"].unique().tolist()
-
-for user in users:
-    user_df = df[df["user_id"] == user].sort_values("date")
-
-    # Streak calculation = consecutive days logged
-    dates = user_df["date"].dt.date.unique()
-    dates_sorted = sorted(dates)
-    streak = 1
-    max_streak = 1
-    for i in range(1, len(dates_sorted)):
-        if (dates_sorted[i] - dates_sorted[i-1]) == datetime.timedelta(days=1):
-            streak += 1
-            max_streak = max(max_streak, streak)
-        else:
-            streak = 1
-
-    latest = user_df.iloc[-1]
-    kwh = latest["kwh"]
-    cost = latest["cost_rs"]
-    co2 = latest["co2_kg"]
+# Badge rules: (label, column of the card table that must be True)
+BADGES = [
+    (" Power Saver (Saved 5+ kWh)", "badge_power_saver"),
+    (" Cost Cutter (Saved ₹50+)", "badge_cost_cutter"),
+    (" CO₂ Reducer (Cut 2+ kg CO₂)", "badge_co2_reducer"),
+    (" Consistency Champ (3+ day streak)", "badge_consistency"),
+]
 
-    with st.expander(f" {user} — Current Streak: {max_streak} days"):
+SORT_OPTIONS = {
+    "Current streak": ("current_streak", False),
+    "Best streak": ("max_streak", False),
+    "Latest kWh (lowest first)": ("kwh", True),
+    "Badges": ("badges", False),
+    "User ID": ("user_id", True),
+}
+
+def build_cards():
+    """One row per user with streaks, latest metrics and badges, built in bulk
+    from the precomputed streak, rollup and latest-row views."""
+    totals = get_rollups().summary("user")
+    cards = get_streaks().table[["current_streak", "max_streak", "active_days"]].join(
+        get_latest()[["kwh", "cost_rs", "co2_kg"]], how="inner")
+    cards["badge_power_saver"] = (totals["kwh_max"] - totals["kwh_min"]).reindex(cards.index) >= 5
+    cards["badge_cost_cutter"] = (totals["cost_rs_max"] - totals["cost_rs_min"]).reindex(cards.index) >= 50
+    cards["badge_co2_reducer"] = (totals["co2_kg_max"] - totals["co2_kg_min"]).reindex(cards.index) >= 2
+    cards["badge_consistency"] = cards["max_streak"] >= 3
+    cards["badges"] = cards[[col for _, col in BADGES]].sum(axis=1)
+    return cards.reset_index()
+
+with timer("streaks.aggregate", section="cards") as t:
+    cards = build_cards()
+    t["users"] = len(cards)
+
+c1, c2, c3 = st.columns([2, 2, 1])
+search = c1.text_input("Search users", "")
+sort_label = c2.selectbox("Sort by", list(SORT_OPTIONS))
+page_size = c3.selectbox("Per page", [10, 25, 50], index=0)
+
+if search:
+    cards = cards[cards["user_id"].str.contains(search, case=False, regex=False)]
+sort_col, ascending = SORT_OPTIONS[sort_label]
+cards = cards.sort_values([sort_col, "user_id"], ascending=[ascending, True], kind="stable")
+
+n_pages = max(1, -(-len(cards) // page_size))
+page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+visible = cards.iloc[(page - 1) * page_size: page * page_size]
+st.caption(f"Showing {len(visible)} of {len(cards)} users")
+
+# Only the visible users' rows are pulled out for their charts
+page_rows = df[df["user_id"].isin(visible["user_id"])]
+rows_by_user = {str(u): g for u, g in page_rows.groupby("user_id", observed=True)}
+
+for card in visible.itertuples(index=False):
+    user = card.user_id
+    with st.expander(f" {user} — Current Streak: {card.current_streak} days (best {card.max_streak})"):
         col1, col2, col3 = st.columns(3)
-        col1.metric(" kWh (latest)", f"{kwh:.2f}")
-        col2.metric(" Cost (Rs)", f"₹ {cost:.2f}")
-        col3.metric(" CO₂ (kg)", f"{co2:.2f}")
+        col1.metric(" kWh (latest)", f"{card.kwh:.2f}")
+        col2.metric(" Cost (Rs)", f"₹ {card.cost_rs:.2f}")
+        col3.metric(" CO₂ (kg)", f"{card.co2_kg:.2f}")
 
         # Show user trend
-        fig = px.line(
-            user_df,
-            x="date", y="kwh", markers=True,
-            title=f"{user} — Energy Usage Trend"
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        with timer("streaks.chart", section="user_trend"):
+            user_df = rows_by_user.get(user, df.iloc[0:0])
+            trend, _ = resample_series(user_df)
+            import plotly.express as px  # deferred until a chart is drawn (see startup.py)
+            fig = px.line(
+                trend,
+                x="date", y="kwh", markers=True,
+                title=f"{user} — Energy Usage Trend"
+            )
+            st.plotly_chart(fig, use_container_width=True)
 
         # Gamified badges
         st.markdown(" **Badges Earned:**")
-        badges = []
-        if user_df["kwh"].max() - user_df["kwh"].min() >= 5:
-            badges.append(" Power Saver (Saved 5+ kWh)")
-        if (user_df["cost_rs"].max() - user_df["cost_rs"].min()) >= 50:
-            badges.append(" Cost Cutter (Saved ₹50+)")
-        if (user_df["co2_kg"].max() - user_df["co2_kg"].min()) >= 2:
-            badges.append(" CO₂ Reducer (Cut 2+ kg CO₂)")
-        if max_streak >= 3:
-            badges.append(" Consistency Champ (3+ day streak)")
-
+        badges = [label for label, col in BADGES if getattr(card, col)]
         if badges:
             for b in badges:
                 st.success(b)
@@ -146,3 +177,5 @@ reminders = [
 
 for r in reminders:
     st.info(r)
+
+page_finished()
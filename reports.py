@@ -0,0 +1,272 @@
+"""Headless per-user and cohort reports for a whole campaign.
+
+Usage:
+    python reports.py [--out DIR] [--formats html,pdf] [--workers 4] [--force]
+
+Writes, under the output directory (REPORTS_DIR by default):
+    index.html          cohort impact metrics, a cohort chart and links
+    users/<id>.html     per-user summary table and trend chart (PNG)
+    users/<id>.pdf      the same as a one-page PDF, with --formats pdf
+    manifest.json       fingerprint of each user's rows at the last run
+
+Summaries are computed for every user at once in this process. Charts are
+drawn in a process pool, in batches of users. A user whose rows have the
+same fingerprint as in the manifest, and all the requested files, keeps the
+report from the previous run.
+"""
+import argparse
+import html
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from downsample import resample_series
+from impact import habit_table
+from rollups import get_rollups
+from streaks import get_streaks
+from tips import get_tips
+from utils import HEADERS, read_logs
+from whatif import get_usage_totals
+
+REPORTS_DIR = os.path.join(tempfile.gettempdir(), "energy_reports")
+REPORT_VERSION = 1       # bump when the report layout changes to regenerate everything
+BATCH_SIZE = 50          # users per worker task
+DAYS_PER_MONTH = 30
+
+SUMMARY_LABELS = {
+    "days_logged": "Days logged",
+    "current_streak": "Current streak (days)",
+    "max_streak": "Best streak (days)",
+    "kwh_total": "Total kWh",
+    "kwh_baseline": "Avg kWh/day (baseline)",
+    "kwh_post": "Avg kWh/day (post)",
+    "kwh_saved_month": "kWh saved per month",
+    "rs_saved_month": "₹ saved per month",
+    "co2_saved_month": "kg CO₂ avoided per month",
+    "habits": "Habits adopted",
+    "score": "Efficiency score",
+}
+
+
+def fingerprints(df):
+    """{user_id: fingerprint} that changes whenever any of the user's rows do."""
+    users = df["user_id"].astype(str).to_numpy()
+    row_hash = pd.util.hash_pandas_object(df[HEADERS], index=False).to_numpy()
+    order = np.argsort(users, kind="stable")
+    users, row_hash = users[order], row_hash[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else np.array([], dtype=int)
+    # uint64 sums wrap around, which is fine for a fingerprint
+    sums = np.add.reduceat(row_hash, starts) if len(starts) else []
+    counts = np.diff(np.r_[starts, len(users)])
+    return {u: f"{REPORT_VERSION}-{n}-{s:016x}" for u, n, s in zip(users[starts], counts, sums)}
+
+
+def user_summaries():
+    """One row per user with the figures shown in the reports (see SUMMARY_LABELS)."""
+    per_period = get_rollups().summary("user_period")
+    means = {
+        metric: per_period[f"{metric}_mean"].unstack("period").reindex(columns=["baseline", "post"])
+        for metric in ("kwh", "cost_rs", "co2_kg")
+    }
+    totals = get_rollups().summary("user")
+    streaks = get_streaks().table
+    habits = habit_table(get_usage_totals().table)
+
+    out = pd.DataFrame(index=totals.index)
+    out["days_logged"] = streaks["active_days"].reindex(out.index).fillna(0).astype(int)
+    out["current_streak"] = streaks["current_streak"].reindex(out.index).fillna(0).astype(int)
+    out["max_streak"] = streaks["max_streak"].reindex(out.index).fillna(0).astype(int)
+    out["kwh_total"] = totals["kwh_sum"]
+    out["kwh_baseline"] = means["kwh"]["baseline"].reindex(out.index)
+    out["kwh_post"] = means["kwh"]["post"].reindex(out.index)
+    for metric, column in (("kwh", "kwh_saved_month"), ("cost_rs", "rs_saved_month"), ("co2_kg", "co2_saved_month")):
+        m = means[metric].reindex(out.index)
+        out[column] = (m["baseline"] - m["post"]) * DAYS_PER_MONTH
+    out["habits"] = habits.sum(axis=1).reindex(out.index).fillna(0).astype(int)
+    out["score"] = get_tips().table["score"].reindex(out.index)
+    return out
+
+
+def cohort_metrics(summary):
+    """The campaign's impact metrics from the per-user summary table."""
+    compared = summary.dropna(subset=["kwh_baseline", "kwh_post"])
+    return {
+        "Participants": len(summary),
+        "With baseline and post logs": len(compared),
+        "% adopting at least 1 habit": 100 * (compared["habits"] > 0).mean() if len(compared) else float("nan"),
+        "kWh saved per month": compared["kwh_saved_month"].sum(),
+        "₹ saved per month": compared["rs_saved_month"].sum(),
+        "kg CO₂ avoided per month": compared["co2_saved_month"].sum(),
+    }
+
+
+def _file_name(user_id):
+    return quote(str(user_id), safe="")
+
+
+def _format(value):
+    if isinstance(value, (float, np.floating)):
+        return "–" if np.isnan(value) else f"{value:,.2f}"
+    return f"{value:,}" if isinstance(value, (int, np.integer)) else html.escape(str(value))
+
+
+def _table_html(items):
+    rows = "".join(f"<tr><th>{html.escape(k)}</th><td>{_format(v)}</td></tr>" for k, v in items)
+    return f"<table>{rows}</table>"
+
+
+_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:sans-serif;margin:2em}} th{{text-align:left;padding-right:2em}} img{{max-width:900px}}</style>
+</head><body><h1>{title}</h1>{body}</body></html>
+"""
+
+
+class _TrendChart:
+    """One reusable figure: redrawing a line is much cheaper than building a
+    new figure for every user."""
+
+    def __init__(self, with_table=False):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        self.fig = plt.figure(figsize=(9, 6 if with_table else 4))
+        self.ax = self.fig.add_subplot(2 if with_table else 1, 1, 1)
+        self.ax.xaxis_date()
+        (self.line,) = self.ax.plot([], [], marker="o", markersize=3)
+        self.ax.set_ylabel("kWh")
+        self.ax.grid(True)
+        self.table_ax = self.fig.add_subplot(2, 1, 2) if with_table else None
+        self.fig.subplots_adjust(left=0.08, right=0.97, top=0.92, bottom=0.1)
+
+    def save(self, rows, title, path, summary_items=None, dpi=80):
+        trend, bucket = resample_series(rows)
+        self.line.set_data(trend["date"], trend["kwh"])
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.set_title(title if bucket == "raw" else f"{title} (average per {bucket})")
+        if self.table_ax is not None:
+            self.table_ax.clear()
+            self.table_ax.axis("off")
+            self.table_ax.table(cellText=[[k, _format(v)] for k, v in summary_items], loc="center", cellLoc="left")
+        self.fig.savefig(path, dpi=dpi)
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+
+
+def _render_batch(batch, out_dir, formats):
+    """Worker: write the reports for a list of (user_id, rows, summary items)."""
+    users_dir = os.path.join(out_dir, "users")
+    chart = _TrendChart()
+    pdf_chart = _TrendChart(with_table=True) if "pdf" in formats else None
+    try:
+        for user_id, rows, items in batch:
+            name = _file_name(user_id)
+            title = f"{user_id} — daily energy use"
+            chart.save(rows, title, os.path.join(users_dir, f"{name}.png"))
+            pdf_path = os.path.join(users_dir, f"{name}.pdf")
+            if pdf_chart is not None:
+                pdf_chart.save(rows, title, pdf_path, items)
+            elif os.path.exists(pdf_path):
+                os.remove(pdf_path)  # out of date now; a later pdf run redraws it
+            body = (_table_html(items) + f'<p><img src="{quote(name)}.png" alt="kWh trend"></p>'
+                    '<p><a href="../index.html">Cohort report</a></p>')
+            with open(os.path.join(users_dir, f"{name}.html"), "w", encoding="utf-8") as f:
+                f.write(_PAGE.format(title=html.escape(f"Energy report — {user_id}"), body=body))
+    finally:
+        chart.close()
+        if pdf_chart is not None:
+            pdf_chart.close()
+    return len(batch)
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("users", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def generate_reports(out_dir=REPORTS_DIR, formats=("html",), workers=None, force=False):
+    """Write the cohort report and every changed user's report. Returns a stats dict."""
+    started = time.perf_counter()
+    users_dir = os.path.join(out_dir, "users")
+    os.makedirs(users_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+
+    df = read_logs()
+    df = df[df["user_id"].notna()]
+    current = fingerprints(df)
+    previous = {} if force else _load_manifest(manifest_path)
+    extensions = ["html", "png"] + (["pdf"] if "pdf" in formats else [])
+    changed = [u for u, fp in current.items()
+               if previous.get(u) != fp
+               or not all(os.path.exists(os.path.join(users_dir, f"{_file_name(u)}.{ext}")) for ext in extensions)]
+
+    summary = user_summaries()
+    if changed:
+        wanted = set(changed)
+        rows_by_user = {str(u): g for u, g in df.groupby("user_id", observed=True) if str(u) in wanted}
+        tasks = [
+            [(u, rows_by_user[u], [(SUMMARY_LABELS[c], summary.at[u, c]) for c in SUMMARY_LABELS]) for u in changed[i:i + BATCH_SIZE]]
+            for i in range(0, len(changed), BATCH_SIZE)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(_render_batch, tasks, [out_dir] * len(tasks), [tuple(formats)] * len(tasks)):
+                pass
+
+    # Users no longer in the log lose their reports.
+    for user_id in set(previous) - set(current):
+        for ext in ("html", "png", "pdf"):
+            path = os.path.join(users_dir, f"{_file_name(user_id)}.{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    _write_cohort_report(out_dir, df, summary)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "users": current}, f, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return {"users": len(current), "regenerated": len(changed), "seconds": time.perf_counter() - started}
+
+
+def _write_cohort_report(out_dir, df, summary):
+    daily = df.groupby("date", observed=True)["kwh"].sum().reset_index()
+    chart = _TrendChart()
+    try:
+        chart.save(daily, "Cohort — total kWh per day", os.path.join(out_dir, "cohort.png"))
+    finally:
+        chart.close()
+
+    metrics = _table_html(cohort_metrics(summary).items())
+    table = summary.rename(columns=SUMMARY_LABELS).round(2)
+    table.index = [f'<a href="users/{quote(_file_name(u))}.html">{html.escape(u)}</a>' for u in table.index]
+    body = (metrics + '<p><img src="cohort.png" alt="Cohort kWh trend"></p><h2>Participants</h2>'
+            + table.to_html(escape=False, na_rep="–"))
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(_PAGE.format(title="Energy Savings Campaign — cohort report", body=body))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate per-user and cohort reports from the energy log.")
+    parser.add_argument("--out", default=REPORTS_DIR, help="output directory")
+    parser.add_argument("--formats", default="html", help="comma-separated: html (always, with PNG charts), pdf")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--force", action="store_true", help="regenerate every user, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    stats = generate_reports(args.out, formats=args.formats.split(","), workers=args.workers, force=args.force)
+    print(f"{stats['users']} users, {stats['regenerated']} reports regenerated in {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Incrementally maintained rollups of kWh, cost and CO₂.
+
+For each grain (per user, per period, per user and period, per day) the view
+keeps count, sum, min and max of every metric. Appended rows are aggregated
+on their own and merged into the existing table, so summaries cost
+O(groups) instead of a groupby over the whole log on every rerun. When
+entries are replaced or deleted, only the groups that lost rows are
+aggregated again from the log (a min or max can't be taken back). A second
+view keeps each user's latest row the same way.
+"""
+import pandas as pd
+
+from utils import get_view, register_view
+
+METRICS = ["kwh", "cost_rs", "co2_kg"]
+STATS = ["count", "sum", "min", "max"]
+
+GRAINS = {
+    "user": ["user_id"],
+    "period": ["period"],
+    "user_period": ["user_id", "period"],
+    "day": ["date"],
+}
+
+_MERGE = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+
+def aggregate(df, keys):
+    """count/sum/min/max of METRICS grouped by ``keys``, with flat column names."""
+    columns = [f"{m}_{s}" for m in METRICS for s in STATS]
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.MultiIndex.from_arrays([[]] * len(keys), names=keys))
+    # float64 so sums don't drift when merged over many appends
+    values = df[keys].join(df[METRICS].astype("float64"))
+    agg = values.groupby(keys, observed=True)[METRICS].agg(STATS)
+    agg.columns = columns
+    agg = agg.reset_index()
+    for k in keys:
+        if isinstance(agg[k].dtype, pd.CategoricalDtype):
+            agg[k] = agg[k].astype(str)
+    return agg.set_index(keys)
+
+
+def in_groups(df, keys, groups):
+    """Mask of the rows of ``df`` that fall in one of ``groups`` (an index as made by aggregate())."""
+    mask = df[keys[0]].isin(groups.get_level_values(0)).to_numpy(copy=True)
+    if len(keys) > 1 and mask.any():
+        rows = df[mask]
+        cols = [rows[k].astype(str) if isinstance(rows[k].dtype, pd.CategoricalDtype) else rows[k] for k in keys]
+        mask[mask] = pd.MultiIndex.from_arrays(cols, names=keys).isin(groups)
+    return mask
+
+
+def merge(table, part):
+    """Combine two aggregate tables into one."""
+    if part.empty:
+        return table
+    if table.empty:
+        return part
+    both = pd.concat([table, part])
+    funcs = {c: _MERGE[c.rsplit("_", 1)[1]] for c in both.columns}
+    return both.groupby(level=list(range(both.index.nlevels))).agg(funcs)
+
+
+class Rollups:
+    """The log's rollup tables, one per grain in GRAINS."""
+
+    def __init__(self, df):
+        self.tables = {grain: aggregate(df, keys) for grain, keys in GRAINS.items()}
+
+    def update(self, new_rows, df, removed):
+        tables = {}
+        for grain, keys in GRAINS.items():
+            table, part = self.tables[grain], new_rows
+            if not removed.empty:
+                stale = aggregate(removed, keys).index
+                table = merge(table.drop(index=stale, errors="ignore"), aggregate(df[in_groups(df, keys, stale)], keys))
+                part = new_rows[~in_groups(new_rows, keys, stale)]
+            tables[grain] = merge(table, aggregate(part, keys))
+        self.tables = tables
+
+    def summary(self, grain):
+        """The rollup for ``grain`` with a ``<metric>_mean`` column per metric."""
+        table = self.tables[grain].copy()
+        for m in METRICS:
+            table[f"{m}_mean"] = table[f"{m}_sum"] / table[f"{m}_count"]
+        return table
+
+    def overall(self):
+        """count/sum/min/max/mean of each metric over the whole log (a Series)."""
+        table = self.tables["user"]
+        out = {}
+        for m in METRICS:
+            out[f"{m}_count"] = table[f"{m}_count"].sum()
+            out[f"{m}_sum"] = table[f"{m}_sum"].sum()
+            out[f"{m}_min"] = table[f"{m}_min"].min()
+            out[f"{m}_max"] = table[f"{m}_max"].max()
+            out[f"{m}_mean"] = out[f"{m}_sum"] / out[f"{m}_count"] if out[f"{m}_count"] else float("nan")
+        return pd.Series(out)
+
+
+class LatestRows:
+    """Each user's most recent log row (latest date; the last saved on ties)."""
+
+    def __init__(self, df):
+        self.table = self._latest(df)
+
+    @staticmethod
+    def _latest(df):
+        df = df[df["user_id"].notna()]
+        latest = df.sort_values("date", kind="stable", na_position="first").groupby("user_id", observed=True).tail(1)
+        return latest.drop(columns="user_id").set_index(latest["user_id"].astype(str))
+
+    def update(self, new_rows, df, removed):
+        # Users who lost a row are looked up again in the log
+        stale = removed["user_id"].dropna().astype(str).unique()
+        table = self.table.drop(index=stale, errors="ignore")
+        # Rows appended later win ties, so the existing table goes first.
+        candidates = [table.reset_index(names="user_id"), new_rows[~new_rows["user_id"].isin(stale)]]
+        if len(stale):
+            candidates.append(df[df["user_id"].isin(stale)])
+        self.table = self._latest(pd.concat(candidates, ignore_index=True))
+
+
+register_view("rollups", Rollups)
+register_view("latest", LatestRows)
+
+
+def get_rollups():
+    """The shared, up-to-date Rollups for the current log."""
+    return get_view("rollups")
+
+
+def get_latest():
+    """Each user's latest row as a DataFrame indexed by user_id."""
+    return get_view("latest").table
@@ -0,0 +1,93 @@
+"""Cold-start support: background warm-up and time-to-render metrics.
+
+The first script run in a server process starts warm_up() in a daemon
+thread. It loads the log (from the Parquet snapshot when there is one),
+refreshes the snapshot for the next restart, and then, once the first page
+has rendered (or after FIRST_RENDER_WAIT seconds), builds the derived
+views the other pages use and imports the charting libraries. Building
+them earlier would compete with the first page for the interpreter. A page
+that needs the log before the thread has loaded it waits for the same load
+instead of starting a second one. Set ENERGY_WARMUP=0 to turn it off.
+
+Each page script calls page_started() at the top and page_finished() at the
+end. That records the render time as stage ``render.<page>``, and the time
+from the first script run in the process to the end of its first page
+render as ``startup.first_render`` (see the diagnostics view). Pages that
+stop early (e.g. with no data) are not timed.
+"""
+import os
+import threading
+import time
+from importlib import import_module
+
+import streamlit as st
+
+from metrics import count, record, timer
+from utils import get_view, read_logs, save_log_snapshot
+
+ENABLED = os.environ.get("ENERGY_WARMUP", "1") != "0"
+# view name -> module that registers it, landing page's views first
+WARM_VIEWS = {
+    "rollups": "rollups",
+    "usage_totals": "whatif",
+    "latest": "rollups",
+    "streaks": "streaks",
+    "tips": "tips",
+    "leaderboard": "leaderboard",
+    "forecast": "forecast",
+    "anomalies": "anomalies",
+}
+WARM_MODULES = ["plotly.express", "matplotlib.pyplot"]
+FIRST_RENDER_WAIT = 30.0   # seconds the view builds wait for the first page
+
+_PROCESS_START = time.perf_counter()   # first import: the process's first script run
+_lock = threading.Lock()
+_warm_started = False
+_first_rendered = threading.Event()
+
+
+def _warm():
+    try:
+        with timer("startup.warm") as t:
+            t["rows"] = len(read_logs())
+            t["snapshot_rows"] = save_log_snapshot()
+            _first_rendered.wait(FIRST_RENDER_WAIT)
+            for name, module in WARM_VIEWS.items():
+                import_module(module)
+                get_view(name)
+            for module in WARM_MODULES:
+                import_module(module)
+    except Exception:  # best effort: pages load whatever they need themselves
+        count("startup.warm_failed")
+
+
+def warm_up():
+    """Start the background warm-up, once per process."""
+    global _warm_started
+    with _lock:
+        if _warm_started or not ENABLED:
+            return
+        _warm_started = True
+    threading.Thread(target=_warm, name="warm-up", daemon=True).start()
+
+
+def page_started(page):
+    """Start the warm-up (first run only) and this run's render clock."""
+    warm_up()
+    st.session_state["_render_clock"] = (page, time.perf_counter())
+
+
+def page_finished():
+    """Record how long this run of the page took to render."""
+    page, start = st.session_state.pop("_render_clock", (None, None))
+    if start is None:
+        return
+    now = time.perf_counter()
+    seen = st.session_state.setdefault("_rendered_pages", set())
+    record(f"render.{page}", (now - start) * 1000, first_in_session=page not in seen)
+    seen.add(page)
+    with _lock:
+        first = not _first_rendered.is_set()
+        _first_rendered.set()
+    if first:
+        record("startup.first_render", (now - _PROCESS_START) * 1000, page=page)
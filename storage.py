@@ -0,0 +1,550 @@
+"""Storage backends for the energy log.
+
+utils.py talks to the active backend through a small interface:
+init(), read(...), users(), append(df), append_batches(frames),
+compact() and move_out(before, sink), plus version(), snapshot() and read_since(cursor) for the shared
+in-memory cache (and tombstones() on indexed stores). The CSV store keeps
+the original logs.csv format; the SQLite store keeps the same columns in an
+indexed table so per-user and date-range queries don't scan every row.
+
+Rows are keyed on (user_id, date, period). A row replaces any earlier row
+with the same key, and a tombstone (a row with only the key columns set)
+deletes it. The CSV store appends both and leaves it to the reader to keep
+the last row per key; the SQLite store keeps one row per key with a unique
+index. Tombstones stay in the log (compaction keeps them), so a deleted
+entry can't come back from the archive.
+
+Writers may live in different processes (several Streamlit servers, the CLI
+tools), so the CSV store takes an exclusive lock on a ".lock" sidecar file
+around every append and compaction; SQLite does its own locking.
+"""
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from metrics import count
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: pandas' (slower) CSV writer is used instead
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CSV_CHUNKSIZE = 100_000
+
+KEY_COLUMNS = ["user_id", "date", "period"]
+
+# Read the key columns as text so ids like "007" aren't guessed to be numbers
+# (and parsed differently by a full read than by a read of only new rows).
+_CSV_DTYPES = {c: str for c in KEY_COLUMNS}
+
+_SQL_TYPES = {
+    "washing_cycles": "INTEGER",
+    "user_id": "TEXT",
+    "date": "TEXT",
+    "period": "TEXT",
+}
+
+
+def _date_str(value):
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def _equals(series, value):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series == str(value)
+    return series.astype(str) == str(value)
+
+
+def filter_frame(df, user_id=None, start=None, end=None, period=None):
+    mask = pd.Series(True, index=df.index)
+    if user_id is not None:
+        mask &= _equals(df["user_id"], user_id)
+    if period is not None:
+        mask &= _equals(df["period"], period)
+    if start is not None or end is not None:
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        if start is not None:
+            mask &= dates >= pd.Timestamp(_date_str(start))
+        if end is not None:
+            mask &= dates <= pd.Timestamp(_date_str(end))
+    return df[mask]
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive, process-wide lock on ``path + ".lock"``."""
+    with open(path + ".lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s; keep waiting
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _text_entries(df, headers):
+    """(latest row per key, tombstone) masks of a log read as text.
+
+    Rows with part of the key missing can't be replaced and are all kept.
+    """
+    keyed = (df[KEY_COLUMNS] != "").all(axis=1)
+    latest = ~(keyed & df.duplicated(subset=KEY_COLUMNS, keep="last"))
+    tombstone = keyed & (df[[c for c in headers if c not in KEY_COLUMNS]] == "").all(axis=1)
+    return latest, tombstone
+
+
+def _csv_rows(df):
+    """Encode rows as CSV lines without a header."""
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            out = io.BytesIO()
+            pa_csv.write_csv(table, out, pa_csv.WriteOptions(include_header=False))
+            return out.getvalue()
+        except (TypeError, ValueError):  # mixed-type object columns
+            pass
+    return df.to_csv(index=False, header=False).encode("utf-8")
+
+
+def _ensure_trailing_newline(path):
+    # A hand-edited file may lack the final newline; appending would then
+    # glue the new row onto the last existing one.
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+class CSVStore:
+    """The original single-file CSV log. Writes are append-only: corrections
+    and tombstones are appended too, and compact() drops the rows they replace."""
+
+    name = "csv"
+    indexed = False
+
+    def __init__(self, path, headers):
+        self.path = path
+        self.headers = list(headers)
+
+    def _needs_header(self):
+        return not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+    def init(self):
+        if self._needs_header():
+            with file_lock(self.path):
+                if self._needs_header():
+                    pd.DataFrame(columns=self.headers).to_csv(self.path, index=False)
+
+    def read(self, user_id=None, start=None, end=None, period=None, columns=None):
+        self.init()
+        filtered = any(v is not None for v in (user_id, start, end, period))
+        usecols = None
+        if columns is not None:
+            # Filter columns must be parsed even when they are not returned.
+            keys = [c for c, v in (("user_id", user_id), ("date", start if start is not None else end),
+                                   ("period", period)) if v is not None]
+            usecols = list(dict.fromkeys(list(columns) + keys))
+        try:
+            if not filtered:
+                df = pd.read_csv(self.path, usecols=usecols, dtype=_CSV_DTYPES)
+            else:
+                # Filter chunk by chunk so memory stays bounded by the result.
+                parts = [
+                    filter_frame(chunk, user_id, start, end, period)
+                    for chunk in pd.read_csv(self.path, usecols=usecols, dtype=_CSV_DTYPES, chunksize=CSV_CHUNKSIZE)
+                ]
+                df = pd.concat(parts, ignore_index=True)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=self.headers)
+        return df[list(columns)] if columns is not None else df
+
+    def users(self):
+        return self.read(columns=["user_id"])["user_id"].dropna().astype(str).unique().tolist()
+
+    def version(self):
+        """Changes whenever the file is appended to or replaced."""
+        self.init()
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def snapshot(self):
+        """Read every row. Returns (df, cursor) for later read_since() calls."""
+        self.init()
+        with open(self.path, "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        count("log.bytes_read", len(data))
+        # Stop at the last complete line; a row still being written is picked
+        # up by the next read_since().
+        end = data.rfind(b"\n") + 1
+        try:
+            df = pd.read_csv(io.BytesIO(data if end == len(data) else data[:end]), dtype=_CSV_DTYPES)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=self.headers)
+        return df, (ino, end)
+
+    def read_since(self, cursor):
+        """Rows appended after ``cursor`` as (df, cursor), or None if the file
+        was replaced (e.g. compacted) and needs a full snapshot()."""
+        ino, offset = cursor
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if st.st_ino != ino or st.st_size < offset:
+            return None
+        if st.st_size == offset:
+            return pd.DataFrame(columns=self.headers), cursor
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != ino:
+                return None
+            f.seek(offset)
+            data = f.read()
+        count("log.bytes_read", len(data))
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return pd.DataFrame(columns=self.headers), cursor
+        df = pd.read_csv(io.BytesIO(data[:end]), header=None, names=self.headers, dtype=_CSV_DTYPES)
+        return df, (ino, offset + end)
+
+    def append(self, df):
+        self.init()
+        data = _csv_rows(df.reindex(columns=self.headers))
+        with file_lock(self.path):
+            _ensure_trailing_newline(self.path)
+            # One write on an O_APPEND descriptor: the rows land contiguously.
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, "O_BINARY", 0))
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+
+    def append_batches(self, frames):
+        """Append an iterable of frames as one unit. Returns the rows written.
+
+        Batches are staged in a temporary file first, so the log lock is held
+        only for the final copy and a failure while producing them leaves the
+        log untouched.
+        """
+        self.init()
+        total = 0
+        fd, staged = tempfile.mkstemp(suffix=".import", dir=os.path.dirname(self.path) or None)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for df in frames:
+                    tmp.write(_csv_rows(df.reindex(columns=self.headers)))
+                    total += len(df)
+            if total:
+                with file_lock(self.path):
+                    _ensure_trailing_newline(self.path)
+                    with open(staged, "rb") as src, open(self.path, "ab") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+        finally:
+            os.unlink(staged)
+        return total
+
+    def compact(self):
+        """Rewrite the log sorted by date and user, keeping only the latest row
+        per key and dropping exact duplicates of the others."""
+        self.init()
+        # Appends wait for the lock, so none can slip in between the read and
+        # the replace and get lost.
+        with file_lock(self.path):
+            try:
+                # Read as text so values are written back exactly as they were logged.
+                df = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame(columns=self.headers)
+            df = df.reindex(columns=self.headers).fillna("")
+            df = df[(df != "").any(axis=1)]
+            latest, _ = _text_entries(df, self.headers)
+            df = df[latest].drop_duplicates().sort_values(["date", "user_id"], kind="stable")
+
+            tmp_file = self.path + ".tmp"
+            df.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, self.path)
+        return len(df)
+
+    def move_out(self, before, sink):
+        """Hand rows dated before ``before`` (every row if None) to ``sink(df)``,
+        then remove them from the log. Returns the number of rows moved.
+
+        Only the latest row per key is moved; the rows it replaced are dropped.
+        Tombstones stay in the log. The rows are removed only once sink() has
+        returned, so a failing sink leaves the log as it was.
+        """
+        self.init()
+        with file_lock(self.path):
+            try:
+                df = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame(columns=self.headers)
+            df = df.reindex(columns=self.headers).fillna("")
+            df = df[(df != "").any(axis=1)]
+            if before is None:
+                out = pd.Series(True, index=df.index)
+            else:
+                out = pd.to_datetime(df["date"], errors="coerce") < pd.Timestamp(_date_str(before))
+            latest, tombstone = _text_entries(df, self.headers)
+            out &= ~(latest & tombstone)
+            moved = df[out & latest]
+            if moved.empty:
+                return 0
+            sink(moved.mask(moved == "").reset_index(drop=True))
+
+            tmp_file = self.path + ".tmp"
+            df[~out].to_csv(tmp_file, index=False)
+            os.replace(tmp_file, self.path)
+        return len(moved)
+
+
+class SQLiteStore:
+    """Log rows in an embedded SQLite table indexed on (user_id, date) and period,
+    with a unique index on the key: writing a row replaces the one with its key."""
+
+    name = "sqlite"
+    indexed = True
+
+    def __init__(self, path, headers):
+        self.path = path
+        self.headers = list(headers)
+        self._ready = False
+        # True for every row except tombstones
+        self._live = f"COALESCE({', '.join(c for c in self.headers if c not in KEY_COLUMNS)}) IS NOT NULL"
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def init(self):
+        if self._ready and os.path.exists(self.path):
+            return
+        cols = ", ".join(f"{c} {_SQL_TYPES.get(c, 'REAL')}" for c in self.headers)
+        con = self._connect()
+        try:
+            # WAL lets readers keep going while a writer commits.
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                con.execute(f"CREATE TABLE IF NOT EXISTS logs ({cols})")
+                con.execute("CREATE INDEX IF NOT EXISTS idx_logs_user_date ON logs (user_id, date)")
+                con.execute("CREATE INDEX IF NOT EXISTS idx_logs_period ON logs (period)")
+                con.execute("CREATE INDEX IF NOT EXISTS idx_logs_date ON logs (date)")
+                # version is bumped by every write; generation only when rows are
+                # removed, which invalidates read_since() cursors.
+                con.execute("CREATE TABLE IF NOT EXISTS log_meta (key TEXT PRIMARY KEY, value INTEGER)")
+                con.execute("INSERT OR IGNORE INTO log_meta VALUES ('version', 0), ('generation', 0)")
+                self._add_key_index(con)
+        finally:
+            con.close()
+        self._ready = True
+
+    def _add_key_index(self, con):
+        exists = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_logs_key'").fetchone()
+        if exists:
+            return
+        # Logs written before the key was enforced may repeat a key; the
+        # last row written is the one that counts.
+        keys = ", ".join(KEY_COLUMNS)
+        keyed = " AND ".join(f"{c} IS NOT NULL" for c in KEY_COLUMNS)
+        removed = con.execute(
+            f"DELETE FROM logs WHERE {keyed} AND rowid NOT IN (SELECT MAX(rowid) FROM logs WHERE {keyed} GROUP BY {keys})"
+        ).rowcount
+        con.execute(f"CREATE UNIQUE INDEX idx_logs_key ON logs ({keys})")
+        if removed:
+            con.execute("UPDATE log_meta SET value = value + 1 WHERE key IN ('version', 'generation')")
+
+    def read(self, user_id=None, start=None, end=None, period=None, columns=None):
+        """Stored rows matching the filters, tombstones included, in write order."""
+        self.init()
+        where, params = [], []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(str(user_id))
+        if period is not None:
+            where.append("period = ?")
+            params.append(str(period))
+        if start is not None:
+            where.append("date >= ?")
+            params.append(_date_str(start))
+        if end is not None:
+            where.append("date <= ?")
+            params.append(_date_str(end))
+        select = ", ".join(columns if columns is not None else self.headers)
+        sql = f"SELECT {select} FROM logs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY rowid"
+        con = self._connect()
+        try:
+            return pd.read_sql_query(sql, con, params=params)
+        finally:
+            con.close()
+
+    def users(self):
+        self.init()
+        con = self._connect()
+        try:
+            # Same order as the CSV store: first appearance in the log.
+            rows = con.execute(
+                f"SELECT user_id FROM logs WHERE user_id IS NOT NULL AND {self._live} GROUP BY user_id ORDER BY MIN(rowid)"
+            )
+            return [r[0] for r in rows]
+        finally:
+            con.close()
+
+    def tombstones(self):
+        """The keys of deleted entries (KEY_COLUMNS) that still have a tombstone."""
+        self.init()
+        con = self._connect()
+        try:
+            return pd.read_sql_query(f"SELECT {', '.join(KEY_COLUMNS)} FROM logs WHERE NOT {self._live}", con)
+        finally:
+            con.close()
+
+    def append(self, df):
+        self.append_batches([df])
+
+    def append_batches(self, frames):
+        """Insert an iterable of frames in a single transaction, each row replacing
+        the one with its key. Returns the rows written."""
+        self.init()
+        placeholders = ", ".join("?" for _ in self.headers)
+        # REPLACE deletes the old row and inserts at a new rowid, so
+        # read_since() picks the new version up like any other new row.
+        sql = f"INSERT OR REPLACE INTO logs ({', '.join(self.headers)}) VALUES ({placeholders})"
+        total = 0
+        con = self._connect()
+        try:
+            with con:
+                for df in frames:
+                    df = df.reindex(columns=self.headers)
+                    df = df.astype(object).where(df.notna(), None)
+                    con.executemany(sql, df.itertuples(index=False, name=None))
+                    total += len(df)
+                con.execute("UPDATE log_meta SET value = value + 1 WHERE key = 'version'")
+        finally:
+            con.close()
+        return total
+
+    def compact(self):
+        """Drop exact duplicate rows (only possible when part of the key is
+        missing) and reclaim free pages."""
+        self.init()
+        cols = ", ".join(self.headers)
+        con = self._connect()
+        try:
+            with con:
+                con.execute(f"DELETE FROM logs WHERE rowid NOT IN (SELECT MIN(rowid) FROM logs GROUP BY {cols})")
+                con.execute("UPDATE log_meta SET value = value + 1 WHERE key IN ('version', 'generation')")
+            con.execute("VACUUM")
+            con.execute("ANALYZE")
+            return con.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+        finally:
+            con.close()
+
+    def move_out(self, before, sink):
+        """Hand rows dated before ``before`` (every row if None) to ``sink(df)``,
+        then delete them. Tombstones stay. Returns the number of rows moved."""
+        self.init()
+        where, params = f" WHERE {self._live}", []
+        if before is not None:
+            where, params = where + " AND date < ?", [_date_str(before)]
+        con = self._connect()
+        try:
+            with con:
+                # Take the write lock first so no insert lands between the
+                # select and the delete.
+                con.execute("BEGIN IMMEDIATE")
+                moved = pd.read_sql_query(f"SELECT {', '.join(self.headers)} FROM logs{where} ORDER BY rowid", con, params=params)
+                if moved.empty:
+                    return 0
+                sink(moved)
+                con.execute(f"DELETE FROM logs{where}", params)
+                con.execute("UPDATE log_meta SET value = value + 1 WHERE key IN ('version', 'generation')")
+            return len(moved)
+        finally:
+            con.close()
+
+    def _meta(self, con):
+        return dict(con.execute("SELECT key, value FROM log_meta"))
+
+    def version(self):
+        self.init()
+        con = self._connect()
+        try:
+            meta = self._meta(con)
+            return (meta["generation"], meta["version"])
+        finally:
+            con.close()
+
+    def _rows_after(self, con, rowid):
+        sql = f"SELECT rowid AS _rowid, {', '.join(self.headers)} FROM logs WHERE rowid > ? ORDER BY rowid"
+        df = pd.read_sql_query(sql, con, params=[rowid])
+        last = int(df["_rowid"].iloc[-1]) if len(df) else rowid
+        return df.drop(columns="_rowid"), last
+
+    def snapshot(self):
+        """Read every row. Returns (df, cursor) for later read_since() calls."""
+        self.init()
+        con = self._connect()
+        try:
+            # One read transaction, so the rows and the generation agree.
+            con.execute("BEGIN")
+            generation = self._meta(con)["generation"]
+            df, last = self._rows_after(con, 0)
+            con.rollback()
+            return df, (generation, last)
+        finally:
+            con.close()
+
+    def read_since(self, cursor):
+        """Rows inserted after ``cursor`` as (df, cursor), or None if rows were
+        removed since and a full snapshot() is needed."""
+        generation, rowid = cursor
+        con = self._connect()
+        try:
+            con.execute("BEGIN")
+            if self._meta(con)["generation"] != generation:
+                return None
+            df, last = self._rows_after(con, rowid)
+            con.rollback()
+            return df, (generation, last)
+        finally:
+            con.close()
+
+    def import_csv(self, csv_path, chunksize=CSV_CHUNKSIZE):
+        """Copy an existing logs.csv into the table. Returns the number of rows imported."""
+        self.init()
+        try:
+            return self.append_batches(pd.read_csv(csv_path, dtype=_CSV_DTYPES, chunksize=chunksize))
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return 0
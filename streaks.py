@@ -0,0 +1,96 @@
+"""Logging streaks and active days for every user at once.
+
+A streak is a run of consecutive calendar days with at least one log. The
+computation works on the unique (user, day) pairs sorted by user and day:
+a new run starts wherever the user changes or the gap to the previous day
+is not exactly one day, so one cumulative sum labels every run in the log.
+"""
+import numpy as np
+import pandas as pd
+
+from utils import get_view, register_view
+
+COLUMNS = ["current_streak", "max_streak", "active_days", "first_day", "last_day"]
+
+
+def user_days(df):
+    """Unique (user_id, day) pairs of a log frame; rows without a date are ignored."""
+    days = pd.DataFrame({
+        "user_id": df["user_id"].astype(str).to_numpy(),
+        "day": df["date"].dt.normalize().to_numpy(),
+    })
+    return days[df["date"].notna().to_numpy() & df["user_id"].notna().to_numpy()].drop_duplicates()
+
+
+def streaks_from_days(days):
+    """Streak table (indexed by user_id) from unique (user_id, day) pairs.
+
+    ``current_streak`` is the run ending on the user's last logged day;
+    ``max_streak`` the longest run; ``active_days`` the number of distinct days.
+    """
+    if days.empty:
+        return pd.DataFrame(columns=COLUMNS, index=pd.Index([], name="user_id"))
+    days = days.sort_values(["user_id", "day"])
+    users = days["user_id"].to_numpy()
+    ordinals = days["day"].to_numpy().astype("datetime64[D]").astype(np.int64)
+
+    starts = np.ones(len(days), dtype=bool)
+    starts[1:] = (users[1:] != users[:-1]) | (np.diff(ordinals) != 1)
+    run_id = np.cumsum(starts) - 1
+    run_len = np.bincount(run_id)[run_id]
+
+    grouped = pd.DataFrame({"user_id": users, "run_len": run_len, "day": days["day"].to_numpy()}).groupby("user_id")
+    return pd.DataFrame({
+        "current_streak": grouped["run_len"].last(),
+        "max_streak": grouped["run_len"].max(),
+        "active_days": grouped["day"].size(),
+        "first_day": grouped["day"].min(),
+        "last_day": grouped["day"].max(),
+    })
+
+
+def compute_streaks(df):
+    """Streak table for every user in a log frame, in one vectorized pass."""
+    return streaks_from_days(user_days(df))
+
+
+class StreakView:
+    """Per-user streaks kept up to date as rows are appended.
+
+    Only users that appear in a new batch are recomputed, from their own
+    logged days. A user who lost an entry has their days read again from the
+    log, since another entry may still cover that day.
+    """
+
+    def __init__(self, df):
+        self.days = user_days(df)
+        self.table = streaks_from_days(self.days)
+
+    def update(self, new_rows, df, removed):
+        stale = removed["user_id"].dropna().astype(str).unique()
+        new_days = user_days(new_rows[~new_rows["user_id"].isin(stale)])
+        if new_days.empty and not len(stale):
+            return
+        affected = np.union1d(new_days["user_id"].unique(), stale)
+        mask = self.days["user_id"].isin(affected).to_numpy()
+        kept = mask & ~self.days["user_id"].isin(stale).to_numpy()
+        touched = [self.days[kept], new_days]
+        if len(stale):
+            touched.append(user_days(df[df["user_id"].isin(stale)]))
+        touched = pd.concat(touched).drop_duplicates()
+        recomputed = streaks_from_days(touched)
+        self.days = pd.concat([self.days[~mask], touched], ignore_index=True)
+        self.table = pd.concat([self.table.drop(index=affected, errors="ignore"), recomputed]).sort_index()
+
+    def for_user(self, user_id):
+        """The streak row for one user, or None if they have no dated logs."""
+        user_id = str(user_id)
+        return self.table.loc[user_id] if user_id in self.table.index else None
+
+
+register_view("streaks", StreakView)
+
+
+def get_streaks():
+    """The shared, up-to-date StreakView for the current log."""
+    return get_view("streaks")
@@ -0,0 +1,208 @@
+"""Slab and time-of-use tariffs, date/region emission factors, and re-pricing.
+
+The log stores cost_rs and co2_kg as they were computed at save time, with
+one flat rate. reprice() recomputes both for any number of rows from the
+logged kWh:
+
+* Slabs apply to each user's cumulative consumption within a calendar
+  month. A day's kWh is split across the slabs it falls into, using one
+  sort and one cumulative sum over the whole log.
+* Time-of-use bands scale the slab rate. The log has one row per day, not
+  hourly readings, so each appliance's kWh is spread over the bands by a
+  typical load profile (LOAD_SHARES) to get a per-row rate multiplier.
+* Emission factors come from a per-region schedule of (effective from,
+  kg/kWh) entries, looked up for each row's date.
+
+Figures in PLANS are illustrative; real bills vary by state and utility.
+"""
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, DEFAULT_EMISSION, compute_energy
+from utils import get_view, read_logs, register_view
+
+# upto_kwh is the monthly cumulative kWh where the slab ends (None: no limit)
+Slab = namedtuple("Slab", ["upto_kwh", "rate"])
+# multiplier is applied to the slab rate for consumption in the band
+TouBand = namedtuple("TouBand", ["name", "hours", "multiplier"])
+TariffPlan = namedtuple("TariffPlan", ["name", "label", "slabs", "bands"])
+
+TOU_BANDS = [
+    TouBand("peak", "18:00–22:00", 1.20),
+    TouBand("normal", "06:00–18:00", 1.00),
+    TouBand("off_peak", "22:00–06:00", 0.80),
+]
+
+# Share of each appliance's daily kWh used in each band (rows sum to 1)
+LOAD_SHARES = {
+    "fan": {"peak": 0.25, "normal": 0.35, "off_peak": 0.40},
+    "light": {"peak": 0.60, "normal": 0.15, "off_peak": 0.25},
+    "ac": {"peak": 0.30, "normal": 0.25, "off_peak": 0.45},
+    "charger": {"peak": 0.25, "normal": 0.25, "off_peak": 0.50},
+    "washing_machine": {"peak": 0.10, "normal": 0.80, "off_peak": 0.10},
+}
+
+_DOMESTIC_SLABS = [Slab(100, 3.00), Slab(300, 4.50), Slab(500, 6.50), Slab(None, 8.00)]
+
+PLANS = {
+    "domestic_slab": TariffPlan("domestic_slab", "Domestic slabs", _DOMESTIC_SLABS, None),
+    "domestic_tod": TariffPlan("domestic_tod", "Domestic slabs + time of day", _DOMESTIC_SLABS, TOU_BANDS),
+}
+
+# region -> [(effective from, kg CO₂ per kWh)], in date order
+EMISSION_FACTORS = {
+    "default": [("2000-01-01", DEFAULT_EMISSION)],
+}
+
+
+def flat_plan(rate):
+    """A single-rate plan, like the sidebar tariff."""
+    return TariffPlan(f"flat_{rate:g}", f"Flat ₹{rate:g}/kWh", [Slab(None, float(rate))], None)
+
+
+def emission_factors(dates, regions=None, schedule=None):
+    """kg CO₂ per kWh for each date (and region; missing or unknown regions use "default")."""
+    schedule = schedule or EMISSION_FACTORS
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[ns]")
+    if regions is None:
+        codes, names = np.zeros(len(dates), dtype=int), ["default"]
+    else:
+        codes, names = pd.factorize(pd.Series(regions).fillna("default").astype(str))
+    out = np.full(len(dates), np.nan)
+    for code, region in enumerate(names):
+        entries = schedule.get(region, schedule["default"])
+        starts = np.array([np.datetime64(pd.Timestamp(d), "ns") for d, _ in entries])
+        factors = np.array([f for _, f in entries], dtype=float)
+        mask = codes == code
+        # The entry in force on each date; dates before the first entry use it too.
+        idx = np.clip(np.searchsorted(starts, dates[mask], side="right") - 1, 0, None)
+        out[mask] = factors[idx]
+    return out
+
+
+def slab_cost(kwh, before, slabs):
+    """Cost of consuming ``kwh`` when ``before`` kWh were already used this month."""
+    kwh = np.asarray(kwh, dtype=float)
+    before = np.asarray(before, dtype=float)
+    after = before + kwh
+    cost = np.zeros(len(kwh))
+    lower = 0.0
+    for slab in slabs:
+        upper = np.inf if slab.upto_kwh is None else float(slab.upto_kwh)
+        in_slab = np.clip(np.minimum(after, upper) - np.maximum(before, lower), 0, None)
+        cost += in_slab * slab.rate
+        lower = upper
+    return cost
+
+
+def tou_multiplier(df, bands, wattages=None, shares=None):
+    """Per-row rate multiplier from the appliance mix and the band multipliers."""
+    shares = shares or LOAD_SHARES
+    per_appliance = compute_energy(df, wattages)
+    # Effective multiplier of each appliance = Σ_band share × band multiplier
+    weights = np.array([
+        sum(shares.get(a.name, {}).get(b.name, 0.0) * b.multiplier for b in bands) or 1.0
+        for a in APPLIANCES
+    ])
+    kwh = per_appliance[[f"kwh_{a.name}" for a in APPLIANCES]].to_numpy()
+    total = kwh.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mult = (kwh @ weights) / total
+    # Rows without usage columns fall back to the normal rate.
+    return np.where(total > 0, mult, 1.0)
+
+
+def reprice(df, plan, regions=None, wattages=None, emission_schedule=None):
+    """cost_rs, co2_kg and the effective tariff for every row of ``df`` under ``plan``.
+
+    ``df`` needs user_id, date and kwh (and the usage columns for ToU plans).
+    Rows are priced in (user, month, date) order; rows on the same day
+    keep the order they were logged in (lexsort is stable).
+    ``regions`` maps user_id -> region for the emission schedule. Returns a
+    DataFrame with the index of ``df``.
+    """
+    n = len(df)
+    kwh = df["kwh"].to_numpy(dtype=float, na_value=0.0)
+    dates = pd.to_datetime(df["date"])
+    month = (dates.dt.year * 12 + dates.dt.month).to_numpy(dtype=np.int64, na_value=0)
+    day = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    users = pd.factorize(df["user_id"])[0]
+
+    # Monthly cumulative kWh before each row: one sort, one cumsum over the
+    # whole log, minus the running total at the start of each user-month.
+    order = np.lexsort((day, month, users))
+    s_kwh = kwh[order]
+    key = users[order] * 1_000_000 + month[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if n else np.array([], dtype=int)
+    cum = np.cumsum(s_kwh)
+    group_start = np.repeat(starts, np.diff(np.r_[starts, n]))
+    before = np.empty(n)
+    before[order] = cum - s_kwh - (cum[group_start] - s_kwh[group_start])
+
+    cost = slab_cost(kwh, before, plan.slabs)
+    if plan.bands:
+        cost *= tou_multiplier(df, plan.bands, wattages)
+    region = None if regions is None else df["user_id"].astype(str).map(regions).to_numpy()
+    factor = emission_factors(dates, region, emission_schedule)
+    return _priced(kwh, cost, factor, df.index)
+
+
+def _priced(kwh, cost, factor, index):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        effective = np.where(kwh > 0, cost / kwh, np.nan)
+    return pd.DataFrame({"cost_rs": cost, "co2_kg": kwh * factor,
+                         "tariff_rs_per_kwh": effective, "emission_factor_kg_per_kwh": factor}, index=index)
+
+
+def _flat_rate(plan):
+    """The plan's rate if it is a single rate (no slabs or bands), else None."""
+    if plan.bands or len(plan.slabs) != 1 or plan.slabs[0].upto_kwh is not None:
+        return None
+    return plan.slabs[0].rate
+
+
+class PricedLog:
+    """The whole log re-priced under one plan, updated per (user, month).
+
+    New or removed rows only change the slab position of rows in their own
+    user-month, so only those user-months are re-priced.
+    """
+
+    def __init__(self, df, plan):
+        self.plan = plan
+        self.table = reprice(df, plan)
+
+    @staticmethod
+    def _user_months(df, users):
+        """An integer (user, month) key per row, users coded against ``users``."""
+        codes = pd.Categorical(df["user_id"], categories=users).codes.astype(np.int64)
+        months = df["date"].to_numpy(dtype="datetime64[M]").astype(np.int64)
+        return codes * 100_000 + months
+
+    def update(self, new_rows, df, removed):
+        users = df["user_id"].cat.categories
+        changed = np.union1d(self._user_months(new_rows, users), self._user_months(removed, users))
+        affected = np.isin(self._user_months(df, users), changed)
+        table = self.table.reindex(df.index)
+        table.loc[affected] = reprice(df[affected], self.plan)
+        self.table = table
+
+
+def get_priced(plan):
+    """The shared, up-to-date re-pricing of the log under ``plan`` (a DataFrame
+    indexed like the cached log).
+
+    A flat rate is priced row by row, without a view: the sidebar rate can
+    take any value, and a view kept per rate would never be freed.
+    """
+    rate = _flat_rate(plan)
+    if rate is not None:
+        df = read_logs()
+        kwh = df["kwh"].to_numpy(dtype=float, na_value=0.0)
+        return _priced(kwh, kwh * rate, emission_factors(df["date"]), df.index)
+    name = f"priced:{plan.name}"
+    register_view(name, partial(PricedLog, plan=plan))
+    return get_view(name).table
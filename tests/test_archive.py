@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive  # noqa: E402
+from utils import HEADERS, apply_schema  # noqa: E402
+
+
+def _rows(*entries):
+    return apply_schema(pd.DataFrame(
+        [{"user_id": u, "date": d, "period": "post", "kwh": kwh} for u, d, kwh in entries]
+    ).reindex(columns=HEADERS))
+
+
+def test_archive_correct_rearchive_compact_read(tmp_path):
+    root = str(tmp_path)
+    archive.write_partitions(root, _rows(("a", "2026-01-05", 1.0), ("b", "2026-01-06", 1.0),
+                                         ("c", "2026-02-03", 1.0)))
+    archive.compact_archive(root)
+    # A correction to an archived month, archived again: January now has two
+    # parts with different categories, February keeps its single part.
+    archive.write_partitions(root, _rows(("a", "2026-01-05", 5.0)))
+    archive.compact_archive(root)
+
+    df = archive.read_archive(root, HEADERS).sort_values(["user_id", "date"])
+    assert df["user_id"].astype(str).tolist() == ["a", "b", "c"]
+    assert df["kwh"].tolist() == [5.0, 1.0, 1.0]
+    assert len(archive.read_archive(root, HEADERS, user_id="a")) == 1
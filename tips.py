@@ -0,0 +1,124 @@
+"""Personalized tips and efficiency scores for every user at once.
+
+Tips are rows of a rule table: when a user's latest logged usage of an
+appliance is above the threshold, suggest cutting it by ``reduction`` units
+a day and show what that saves over a month. All rules are checked against
+all users' latest rows as one (users × rules) comparison, and the result is
+kept as a derived view that only recomputes users with new rows.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, kwh_per_unit
+from rollups import LatestRows
+from utils import get_view, register_view
+
+# threshold and reduction are in the appliance's unit (hours or cycles) per
+# day; days_per_month scales one day's reduction to a month.
+TipRule = namedtuple("TipRule", ["appliance", "threshold", "reduction", "days_per_month",
+                                 "title", "description", "color", "icon"])
+
+RULES = [
+    TipRule("fan", 6, 0.5, 30, "Fan Overuse", "Try reducing fan usage by 30 min/day.", "#FFA726", " "),
+    TipRule("light", 4, 1, 30, "Lights On Too Long", "Switch off lights 1h earlier or use LED bulbs.", "#29B6F6", " "),
+    TipRule("ac", 2, 1, 30, "AC Overuse", "Set AC to 26°C and reduce by 1h/day.", "#EF5350", " "),
+    TipRule("charger", 2, 1, 30, "Chargers Plugged In", "Unplug chargers when not in use.", "#66BB6A", " "),
+    TipRule("washing_machine", 1, 1, 4, "Frequent Washing", "Try reducing washing by 1 cycle/week.", "#AB47BC", " "),
+]
+
+# Efficiency score: 100 minus these points per unit of latest usage, floored at 0
+SCORE_WEIGHTS = {"fan_hours": 2, "ac_hours": 5, "light_hours": 1}
+
+_COLUMN = {a.name: a.column for a in APPLIANCES}
+_KWH_PER_UNIT = dict(zip((a.name for a in APPLIANCES), kwh_per_unit()))
+
+
+def compute_tips(latest, rules=RULES):
+    """Tip table (indexed like ``latest``) from each user's latest log row.
+
+    For each rule ``r`` there are ``tip_<r>`` (bool), ``saved_rs_<r>`` and
+    ``co2_kg_<r>`` (monthly savings if followed). Also ``n_tips``, the total
+    ``saved_rs``/``co2_kg`` of the tips shown, and ``score``. Missing usage
+    counts as zero.
+    """
+    names = [r.appliance for r in rules]
+    usage = np.column_stack([latest[_COLUMN[r.appliance]].to_numpy(dtype=float, na_value=0.0) for r in rules])
+    triggered = usage > np.array([r.threshold for r in rules], dtype=float)
+    # kWh saved per month by each rule, then priced with each user's own tariff/factor
+    monthly_kwh = np.array([r.reduction * _KWH_PER_UNIT[r.appliance] * r.days_per_month for r in rules])
+    tariff = latest["tariff_rs_per_kwh"].to_numpy(dtype=float, na_value=0.0)[:, None]
+    emission = latest["emission_factor_kg_per_kwh"].to_numpy(dtype=float, na_value=0.0)[:, None]
+    saved = monthly_kwh * tariff
+    co2 = monthly_kwh * emission
+
+    out = pd.DataFrame(index=latest.index)
+    for i, name in enumerate(names):
+        out[f"tip_{name}"] = triggered[:, i]
+        out[f"saved_rs_{name}"] = saved[:, i]
+        out[f"co2_kg_{name}"] = co2[:, i]
+    out["n_tips"] = triggered.sum(axis=1)
+    out["saved_rs"] = (saved * triggered).sum(axis=1)
+    out["co2_kg"] = (co2 * triggered).sum(axis=1)
+    penalty = sum(w * latest[col].to_numpy(dtype=float, na_value=0.0) for col, w in SCORE_WEIGHTS.items())
+    out["score"] = np.maximum(0, 100 - penalty.astype(int))
+    return out
+
+
+def tip_cards(row, rules=RULES):
+    """The tips shown for one row of a tip table, as dicts for display."""
+    return [
+        {
+            "title": r.title,
+            "description": r.description,
+            "impact": f"Save ~₹{row[f'saved_rs_{r.appliance}']:.1f}/month | Cut {row[f'co2_kg_{r.appliance}']:.1f} kg CO₂",
+            "color": r.color,
+            "icon": r.icon,
+        }
+        for r in rules if row[f"tip_{r.appliance}"]
+    ]
+
+
+def cohort_summary(table, rules=RULES):
+    """Per rule: users shown the tip, their share of the cohort and the
+    monthly savings if all of them followed it."""
+    n = len(table)
+    rows = []
+    for r in rules:
+        shown = table[f"tip_{r.appliance}"]
+        rows.append({
+            "tip": r.title,
+            "users": int(shown.sum()),
+            "share": shown.mean() if n else 0.0,
+            "saved_rs_per_month": table.loc[shown, f"saved_rs_{r.appliance}"].sum(),
+            "co2_kg_per_month": table.loc[shown, f"co2_kg_{r.appliance}"].sum(),
+        })
+    return pd.DataFrame(rows)
+
+
+class TipsView:
+    """The tip table for every user, recomputed only for users with new or removed rows."""
+
+    def __init__(self, df):
+        self.latest = LatestRows(df)
+        self.table = compute_tips(self.latest.table)
+
+    def update(self, new_rows, df, removed):
+        self.latest.update(new_rows, df, removed)
+        affected = pd.concat([new_rows["user_id"], removed["user_id"]]).dropna().astype(str).unique()
+        recomputed = compute_tips(self.latest.table.loc[self.latest.table.index.intersection(affected)])
+        self.table = pd.concat([self.table.drop(index=affected, errors="ignore"), recomputed])
+
+    def for_user(self, user_id):
+        """The tip row for one user, or None if they have no logs."""
+        user_id = str(user_id)
+        return self.table.loc[user_id] if user_id in self.table.index else None
+
+
+register_view("tips", TipsView)
+
+
+def get_tips():
+    """The shared, up-to-date TipsView for the current log."""
+    return get_view("tips")
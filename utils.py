@@ -1,29 +1,539 @@
-# utils.py
+import json
 import os
+import threading
+import numpy as np
 import pandas as pd
 import tempfile
+from pandas.api.types import union_categoricals
+
+import archive
+from energy import APPLIANCES, USAGE_COLUMNS
+from metrics import count, timer
+from storage import KEY_COLUMNS, CSVStore, SQLiteStore, filter_frame
 
 LOG_FILE = os.path.join(tempfile.gettempdir(), "logs.csv")
+DB_FILE = os.path.join(tempfile.gettempdir(), "logs.db")
+# Parquet files of archived rows, partitioned by month (see archive.py).
+ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), "logs_archive")
+
+# Parquet copy of the typed log plus the store cursor it covers (see save_log_snapshot).
+SNAPSHOT_FILE = os.path.join(tempfile.gettempdir(), "log_snapshot.parquet")
+
+# "csv" (default) keeps everything in LOG_FILE; "sqlite" uses the indexed DB_FILE.
+BACKEND = os.environ.get("ENERGY_LOG_BACKEND", "csv").lower()
 
+# Usage columns come from the appliance table in energy.py
 HEADERS = [
     "user_id","date","period",
-    "fan_hours","light_hours","ac_hours","charger_hours","washing_cycles",
+    *USAGE_COLUMNS,
     "kwh","tariff_rs_per_kwh","cost_rs","emission_factor_kg_per_kwh","co2_kg"
 ]
 
-def init_logs():
-    if not os.path.exists(LOG_FILE) or os.path.getsize(LOG_FILE) == 0:
-        df_init = pd.DataFrame(columns=HEADERS)
-        df_init.to_csv(LOG_FILE, index=False)
+# Each (user_id, date, period) has at most one entry: saving a row with a
+# logged key replaces that entry, and a row with only KEY_COLUMNS set (a
+# tombstone, see delete_logs) deletes it.
+VALUE_COLUMNS = [c for c in HEADERS if c not in KEY_COLUMNS]
+
+# Canonical in-memory types, applied once when rows are loaded. Dates become
+# datetime64, ids/labels categoricals, measurements float32.
+CATEGORY_COLUMNS = ["user_id", "period"]
+FLOAT_COLUMNS = [
+    *[a.column for a in APPLIANCES if a.unit == "hours"],
+    "kwh","tariff_rs_per_kwh","cost_rs","emission_factor_kg_per_kwh","co2_kg"
+]
+INT_COLUMNS = {a.column: "int16" for a in APPLIANCES if a.unit == "cycles"}
+
+def apply_schema(df):
+    """Return ``df`` with the canonical column types.
+
+    Conversion is column-at-a-time: unparseable dates become NaT, bad numbers
+    NaN (missing washing cycles count as 0), ids are kept as text even when
+    they look numeric.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col == "date":
+            s = pd.to_datetime(s, errors="coerce")
+        elif col in CATEGORY_COLUMNS:
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.where(s.isna(), s.astype(str)).astype("category")
+                # An all-missing column would otherwise get object categories,
+                # which union_categoricals refuses to combine with text ones.
+                s = s.cat.set_categories(s.cat.categories.astype(str))
+        elif col in FLOAT_COLUMNS:
+            s = pd.to_numeric(s, errors="coerce").astype("float32")
+        elif col in INT_COLUMNS:
+            s = pd.to_numeric(s, errors="coerce").fillna(0).astype(INT_COLUMNS[col])
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def concat_logs(frames, ignore_index=True):
+    """Concatenate typed log frames, keeping categorical columns categorical."""
+    if len(frames) == 1:
+        return frames[0]
+    out = pd.concat(frames, ignore_index=ignore_index)
+    for col in CATEGORY_COLUMNS:
+        if col in out.columns and not isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = pd.Categorical(union_categoricals([f[col] for f in frames], ignore_order=True))
+    return out
+
+def _hash_text(s):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Hash each category once
+        return pd.util.hash_array(s.cat.categories.astype(str).to_numpy(dtype=object))[s.cat.codes.to_numpy()]
+    return pd.util.hash_array(s.astype(str).to_numpy(dtype=object))
+
+def key_hashes(user_id, dates, period):
+    """uint64 hash of each (user_id, day, period) key."""
+    days = pd.util.hash_array(pd.to_datetime(dates).to_numpy().astype("datetime64[D]").astype(np.int64))
+    with np.errstate(over="ignore"):
+        return (_hash_text(user_id) * np.uint64(1_000_003) ^ days) * np.uint64(1_000_003) ^ _hash_text(period)
+
+def _has_key(df):
+    return df[KEY_COLUMNS].notna().all(axis=1).to_numpy()
+
+def _typed(raw):
+    """(typed frame, tombstone mask) of rows as read from the store."""
+    raw = raw.reindex(columns=HEADERS)
+    df = apply_schema(raw)
+    # Tombstones are told apart before apply_schema fills in missing cycles
+    return df, raw[VALUE_COLUMNS].isna().all(axis=1).to_numpy() & _has_key(df)
+
+def _entries(df, tombstone):
+    """Mask of the rows of ``df`` that are current entries: the last row per
+    key, unless that row is a tombstone. Rows with part of the key missing
+    can't be replaced and are all kept."""
+    keyed = _has_key(df)
+    keep = ~keyed
+    hashes = key_hashes(df["user_id"][keyed], df["date"][keyed], df["period"][keyed])
+    keep[keyed] = ~pd.Series(hashes).duplicated(keep="last").to_numpy()
+    return keep & ~tombstone
+
+def _with_archive(raw, **filters):
+    """Current entries (typed) of the archived rows matching ``filters`` followed
+    by the store rows ``raw``; later rows replace earlier ones with their key."""
+    df, tombstone = _typed(raw)
+    archived = archive.read_archive(ARCHIVE_DIR, HEADERS, **filters)
+    if not archived.empty:
+        archived = apply_schema(archived)
+        df = archived if df.empty else concat_logs([archived, df])
+        tombstone = np.r_[np.zeros(len(archived), dtype=bool), tombstone]
+    keep = _entries(df, tombstone)
+    return df if keep.all() else df[keep].reset_index(drop=True)
+
+def _key_index(df):
+    """Row label of every keyed row of ``df``, indexed by key hash."""
+    keyed = _has_key(df)
+    hashes = key_hashes(df["user_id"][keyed], df["date"][keyed], df["period"][keyed])
+    return pd.Series(df.index[keyed], index=hashes)
+
+def _normalize_keys(df):
+    # Dates are written as YYYY-MM-DD so one day is one key in every store
+    dates = pd.to_datetime(df["date"], errors="coerce")
+    return df.assign(date=dates.dt.strftime("%Y-%m-%d").where(dates.notna(), df["date"]))
 
-def read_logs():
-    init_logs()
+def _snapshot_key(store):
+    # The inode tells a store deleted and created again apart from the one
+    # the snapshot was taken of, even though its cursor may look valid.
     try:
-        return pd.read_csv(LOG_FILE)
-    except pd.errors.EmptyDataError:
-        return pd.DataFrame(columns=HEADERS)
+        inode = os.stat(store.path).st_ino
+    except FileNotFoundError:
+        inode = None
+    return {"backend": BACKEND, "path": os.path.abspath(store.path), "inode": inode, "headers": HEADERS,
+            "keys": KEY_COLUMNS}
+
+def _snapshot_meta(store):
+    """The snapshot's metadata if SNAPSHOT_FILE was taken of ``store``, else None."""
+    try:
+        import pyarrow.parquet as pq
+        meta = (pq.read_schema(SNAPSHOT_FILE).metadata or {}).get(b"energy_snapshot")
+    except (ImportError, OSError, ValueError):  # no pyarrow, no snapshot, or unreadable
+        return None
+    meta = None if meta is None else json.loads(meta)
+    return meta if meta is not None and meta["key"] == _snapshot_key(store) else None
+
+def _read_snapshot(store):
+    """(typed frame, cursor) from SNAPSHOT_FILE if it was taken of ``store``, else None."""
+    meta = _snapshot_meta(store)
+    if meta is None:
+        return None
+    try:
+        import pyarrow.parquet as pq
+        df = pq.read_table(SNAPSHOT_FILE).to_pandas()
+    except (OSError, ValueError):  # replaced or removed since
+        return None
+    return apply_schema(df.reindex(columns=HEADERS)), tuple(meta["cursor"])
+
+def _write_snapshot(store, df, cursor):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = json.dumps({"key": _snapshot_key(store), "cursor": list(cursor)}).encode("utf-8")
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"energy_snapshot": meta})
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(SNAPSHOT_FILE), suffix=".part")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp)
+        os.replace(tmp, SNAPSHOT_FILE)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+_STORES = {
+    "csv": lambda: CSVStore(LOG_FILE, HEADERS),
+    "sqlite": lambda: SQLiteStore(DB_FILE, HEADERS),
+}
+_store = None
+_store_lock = threading.Lock()
+
+class _GroupCommit:
+    """Batch appends from concurrent sessions into a single store write.
+
+    Every Streamlit session runs in its own thread of the same server process.
+    The first thread to get the writer slot flushes everything queued so far
+    in one write; threads that arrive meanwhile find their rows already
+    committed when they get the slot. Callers return only once their rows are
+    on disk, and a failed write is raised in every session of that batch.
+    """
+
+    def __init__(self):
+        self._queue_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._pending = []
+
+    def submit(self, df, write):
+        entry = {"df": df, "done": False, "error": None}
+        with self._queue_lock:
+            self._pending.append(entry)
+        with self._writer_lock:
+            if not entry["done"]:
+                with self._queue_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    if len(batch) == 1:
+                        write(batch[0]["df"])
+                    else:
+                        write(pd.concat([e["df"] for e in batch], ignore_index=True))
+                except Exception as e:
+                    for b in batch:
+                        b["error"] = e
+                finally:
+                    for b in batch:
+                        b["done"] = True
+        if entry["error"] is not None:
+            raise entry["error"]
+
+_group_commit = _GroupCommit()
+
+class _LogCache:
+    """One parsed copy of the full log, shared by every page and session.
+
+    It is keyed on the store's version token (file size/mtime for CSV, a
+    counter bumped by each append for SQLite), so reruns with no new data
+    reuse the same DataFrame. When the version moves, only the rows appended
+    since the last load are read and added; a full reload happens only when
+    the log was rewritten (e.g. compacted).
+
+    Archived rows (see archive_logs) are read once per full reload; moving
+    rows into the archive rewrites the log, which forces that reload.
+
+    Rows read from the store are resolved by key: the frame holds only the
+    current entry per (user_id, date, period), with a hash index from key to
+    row label. A new row finds the entry it replaces with a hash lookup and
+    the stale row is dropped; labels of the other rows never change.
+
+    Derived views (see register_view) are built from the cached frame on
+    first use and then fed each batch of new and removed rows.
+
+    A new process first tries the snapshot written by save_log_snapshot()
+    and reads only the rows appended after it, instead of parsing the whole
+    log; a snapshot the store no longer matches falls back to a full load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+        self._df = None
+        self._keys = None
+        self._next_label = 0
+        self._cursor = None
+        self._version = None
+        self._views = {}
+
+    def _sync(self, store):
+        # Read the version before the data: a write landing in between is
+        # then seen as a version change on the next call.
+        version = store.version()
+        if self._store is store and version == self._version:
+            count("cache.hit")
+            return
+        if self._store is not store:
+            with timer("log.restore") as t:
+                restored = _read_snapshot(store)
+                t["rows"] = None if restored is None else len(restored[0])
+            if restored is not None:
+                count("cache.restore")
+                self._set_frame(restored[0])
+                self._cursor = restored[1]
+                self._store, self._version, self._views = store, None, {}
+        delta = None
+        if self._store is store:
+            with timer("log.read_since") as t:
+                delta = store.read_since(self._cursor)
+                t["rows"] = None if delta is None else len(delta[0])
+        if delta is None:
+            count("cache.reload")
+            with timer("log.load") as t:
+                raw, self._cursor = store.snapshot()
+                self._set_frame(_with_archive(raw))
+                t["rows"] = len(self._df)
+            count("log.rows_read", len(self._df))
+            self._views = {}
+        else:
+            count("cache.refresh")
+            raw, self._cursor = delta
+            count("log.rows_read", len(raw))
+            if not raw.empty:
+                self._apply(raw)
+        self._store = store
+        self._version = version
+
+    def _set_frame(self, df):
+        self._df = df
+        self._keys = _key_index(df)
+        self._next_label = int(df.index.max()) + 1 if len(df) else 0
+
+    def _apply(self, raw):
+        """Fold rows newly read from the store into the frame and the views."""
+        batch, tombstone = _typed(raw)
+        keyed = _has_key(batch)
+        hashes = key_hashes(batch["user_id"][keyed], batch["date"][keyed], batch["period"][keyed])
+        # The entries these rows replace or delete
+        found = self._keys.index.get_indexer(pd.unique(hashes))
+        stale = np.zeros(len(self._keys), dtype=bool)
+        stale[found[found >= 0]] = True
+        removed = self._df.loc[self._keys[stale].to_numpy()]
+        new_rows = batch[_entries(batch, tombstone)]
+        new_rows.index = pd.RangeIndex(self._next_label, self._next_label + len(new_rows))
+        if new_rows.empty and removed.empty:
+            return
+        kept = self._df.drop(index=removed.index) if len(removed) else self._df
+        self._df = new_rows if kept.empty else concat_logs([kept, new_rows], ignore_index=False)
+        self._keys = pd.concat([self._keys[~stale], _key_index(new_rows)])
+        self._next_label += len(new_rows)
+        count("log.rows_replaced", len(removed))
+        for name, view in self._views.items():
+            with timer(f"view.{name}.update", rows=len(new_rows), removed=len(removed)):
+                view.update(new_rows, self._df, removed)
+
+    def get(self, store):
+        with self._lock:
+            self._sync(store)
+            return self._df
+
+    def view(self, store, name):
+        with self._lock:
+            self._sync(store)
+            if name not in self._views:
+                count(f"view.{name}.miss")
+                with timer(f"view.{name}.build", rows=len(self._df)):
+                    self._views[name] = _VIEW_FACTORIES[name](self._df)
+            else:
+                count(f"view.{name}.hit")
+            return self._views[name]
+
+    def entry(self, store, user_id, date, period):
+        with self._lock:
+            self._sync(store)
+            df, keys = self._df, self._keys
+        h = key_hashes(pd.Series([str(user_id)]), pd.Series([pd.Timestamp(date)]), pd.Series([str(period)]))[0]
+        label = keys.get(h)
+        return None if label is None else df.loc[label]
+
+    def save_snapshot(self, store):
+        with self._lock:
+            self._sync(store)
+            df, cursor = self._df, self._cursor
+        # Frames are replaced, never modified, so the write can run unlocked.
+        meta = _snapshot_meta(store)
+        if meta is not None and tuple(meta["cursor"]) == tuple(cursor):
+            return 0
+        with timer("log.snapshot", rows=len(df)):
+            _write_snapshot(store, df, cursor)
+        return len(df)
+
+_VIEW_FACTORIES = {}
+_cache = _LogCache()
+
+def register_view(name, factory):
+    """Register a derived view of the log, kept in step with the shared cache.
+
+    ``factory(df)`` builds the view from the full typed log. The view must
+    have an ``update(new_rows, df, removed)`` method, which is called with
+    each batch of new entries, the full frame after the batch, and the rows
+    the batch took out of the log (entries it replaced or deleted; often
+    empty). Removed rows keep their labels from the frame before the batch,
+    and labels of the other rows don't change. Readers on other sessions may
+    hold the view while it updates, so update() should swap in new
+    attributes rather than mutate the ones it handed out.
+    """
+    _VIEW_FACTORIES[name] = factory
+
+def get_view(name):
+    """Return the up-to-date derived view registered under ``name``."""
+    return _cache.view(get_store(), name)
+
+def get_store():
+    global _store
+    # Locked so the warm-up thread and a page can't create two stores
+    with _store_lock:
+        if _store is None:
+            if BACKEND not in _STORES:
+                raise ValueError(f"Unknown ENERGY_LOG_BACKEND {BACKEND!r}; expected one of {sorted(_STORES)}")
+            _store = _STORES[BACKEND]()
+    return _store
+
+def init_logs():
+    get_store().init()
+
+def read_logs(user_id=None, start=None, end=None, period=None, columns=None):
+    """Return log rows, optionally filtered by user, date range (inclusive) and period.
+
+    Columns come typed (see apply_schema). Unfiltered reads return the
+    process-wide cached DataFrame, which is shared
+    between sessions: treat it as read-only (copy before modifying). Filtered
+    reads are pushed down to an indexed store (SQLite), and to the archive's
+    month/user partitions, or applied to the cached frame (CSV).
+    """
+    store = get_store()
+    filtered = any(v is not None for v in (user_id, start, end, period))
+    if filtered and store.indexed:
+        filters = dict(user_id=user_id, start=start, end=end, period=period)
+        with timer("log.query") as t:
+            # Every column is read, to tell tombstones apart
+            df = _with_archive(store.read(**filters), **filters)
+            t["rows"] = len(df)
+        count("log.rows_read", len(df))
+        return df[list(columns)] if columns is not None else df
+    df = _cache.get(store)
+    if filtered:
+        df = filter_frame(df, user_id, start, end, period)
+    return df[list(columns)] if columns is not None else df
+
+def log_version():
+    """A token that changes whenever the log's contents do."""
+    return get_store().version()
+
+def save_log_snapshot():
+    """Save the cached log as SNAPSHOT_FILE for the next process to start from.
+
+    Returns the rows written, or 0 if the snapshot was already up to date.
+    Needs pyarrow (installed with Streamlit).
+    """
+    return _cache.save_snapshot(get_store())
+
+_users = (None, None, [])  # (store, version, users) of the last indexed-store list_users()
+
+def list_users():
+    """Every logged user, in first-seen order.
+
+    Indexed stores read the archive and the tombstones for this, so the
+    result is kept until the log's version moves instead of redone on every
+    rerun.
+    """
+    global _users
+    store = get_store()
+    if store.indexed:
+        # Read the version before the data (see _LogCache._sync)
+        version = store.version()
+        if _users[0] is store and _users[1] == version:
+            return list(_users[2])
+        archived = apply_schema(archive.read_archive(ARCHIVE_DIR, HEADERS, columns=KEY_COLUMNS))
+        if not archived.empty:
+            # Archived entries deleted since then don't count
+            deleted = apply_schema(store.tombstones()).dropna()
+            archived = archived[_has_key(archived)]
+            archived = archived[~np.isin(key_hashes(archived["user_id"], archived["date"], archived["period"]),
+                                         key_hashes(deleted["user_id"], deleted["date"], deleted["period"]))]
+        users = list(dict.fromkeys(archived["user_id"].dropna().astype(str).tolist() + store.users()))
+        _users = (store, version, users)
+        return list(users)
+    return _cache.get(store)["user_id"].dropna().astype(str).unique().tolist()
+
+def get_log_entry(user_id, date, period):
+    """The logged entry for (user_id, date, period) as a Series, or None.
+
+    Looked up in the cached log's key index, whatever the backend.
+    """
+    return _cache.entry(get_store(), user_id, date, period)
+
+def append_logs(rows):
+    """Save rows (a list of dicts or a DataFrame) to the log.
+
+    A row whose (user_id, date, period) is already logged replaces that
+    entry, so saving the same entry again is harmless. Only the new rows are
+    written, so the cost of a save does not depend on how many entries the
+    log already holds. Safe to call from many sessions at once: concurrent
+    appends are group-committed and never lost.
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if df.empty:
+        return
+    df = df.reindex(columns=HEADERS)
+    if df[VALUE_COLUMNS].isna().all(axis=1).any():
+        # Such a row would be read back as a tombstone
+        raise ValueError("Every row needs a value besides user_id, date and period; use delete_logs() to delete")
+    _group_commit.submit(_normalize_keys(df), get_store().append)
 
 def append_log(row: dict):
-    df = read_logs()
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    df.to_csv(LOG_FILE, index=False)
+    append_logs([row])
+
+def delete_logs(keys):
+    """Delete the entries with the given keys (dicts or a DataFrame with
+    user_id, date and period). Keys that aren't logged are ignored."""
+    df = keys if isinstance(keys, pd.DataFrame) else pd.DataFrame(list(keys))
+    if df.empty:
+        return
+    df = df.reindex(columns=KEY_COLUMNS)
+    if df.isna().any(axis=None):
+        raise ValueError(f"Every key needs {', '.join(KEY_COLUMNS)}")
+    _group_commit.submit(_normalize_keys(df.reindex(columns=HEADERS)), get_store().append)
+
+def delete_log(user_id, date, period):
+    delete_logs([{"user_id": user_id, "date": date, "period": period}])
+
+def append_log_batches(frames):
+    """Append an iterable of DataFrames in one store transaction (bulk imports).
+
+    Frames are consumed lazily, so a large import never has to sit in memory
+    at once. As in append_logs(), a row replaces the entry with its key.
+    Returns the number of rows written.
+    """
+    return get_store().append_batches(_normalize_keys(df.reindex(columns=HEADERS)) for df in frames)
+
+def compact_logs():
+    """Tidy the log on demand (sort / drop rows replaced by a later one). Returns the rows kept."""
+    return get_store().compact()
+
+def archive_logs(before=None, partition_by_user=False):
+    """Move rows dated before ``before`` (all rows if None) out of the log into
+    the Parquet archive. Returns the number of rows moved.
+
+    Archived rows are still returned by read_logs(); filtered reads only open
+    the month (and, with ``partition_by_user``, user) partitions they need.
+    """
+    def sink(df):
+        archive.write_partitions(ARCHIVE_DIR, apply_schema(df), partition_by_user)
+    return get_store().move_out(before, sink)
+
+def compact_archive():
+    """Merge the archive's small part files, one file per partition. Returns the files merged."""
+    return archive.compact_archive(ARCHIVE_DIR)
+
+def import_csv_logs(path=LOG_FILE):
+    """Copy a logs.csv file into the SQLite store. Returns the number of rows imported."""
+    store = get_store()
+    if not isinstance(store, SQLiteStore):
+        raise ValueError("CSV import needs ENERGY_LOG_BACKEND=sqlite")
+    return store.import_csv(path)
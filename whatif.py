@@ -0,0 +1,85 @@
+"""What-if comparisons of logged history against other wattages and tariffs.
+
+kWh is linear in usage, so a scenario's totals for any group of rows only
+need that group's summed usage per appliance. The view keeps those sums per
+(user, period), merged as rows are appended (and subtracted as they are
+replaced or deleted), and a scenario is answered in O(groups × appliances)
+without touching the log rows.
+
+Scenarios use a flat tariff and emission factor; for slab or time-of-day
+pricing see tariffs.py, which needs the rows in date order.
+"""
+import numpy as np
+import pandas as pd
+
+from energy import APPLIANCES, DEFAULT_EMISSION, DEFAULT_TARIFF, USAGE_COLUMNS, kwh_per_unit
+from rollups import merge
+from utils import get_view, register_view
+
+KEYS = ["user_id", "period"]
+LOGGED = ["kwh", "cost_rs", "co2_kg"]
+_SUMS = [f"{c}_sum" for c in USAGE_COLUMNS + LOGGED]
+
+
+def usage_totals(df):
+    """Row count and summed usage / logged kWh, cost and CO₂ per (user, period)."""
+    if df.empty:
+        return pd.DataFrame(columns=["rows_count"] + _SUMS,
+                            index=pd.MultiIndex.from_arrays([[], []], names=KEYS))
+    keys = pd.DataFrame({k: df[k].astype(str).where(df[k].notna(), "") for k in KEYS})
+    # Missing usage counts as zero, as in compute_energy()
+    values = df[USAGE_COLUMNS + LOGGED].astype("float64").fillna(0.0).add_suffix("_sum")
+    values["rows_count"] = 1
+    return values.join(keys).groupby(KEYS).sum()[["rows_count"] + _SUMS]
+
+
+def scenario(totals, wattages=None, tariff=DEFAULT_TARIFF, emission_factor=DEFAULT_EMISSION):
+    """kWh per appliance, kWh, cost and CO₂ for each row of ``totals`` under
+    the given settings, next to the logged kWh/cost/CO₂ and the differences."""
+    usage = totals[[f"{c}_sum" for c in USAGE_COLUMNS]].to_numpy(dtype=float)
+    per_appliance = usage * kwh_per_unit(wattages)
+    out = pd.DataFrame(per_appliance, columns=[f"kwh_{a.name}" for a in APPLIANCES], index=totals.index)
+    out["rows"] = totals["rows_count"].astype(int)
+    out["kwh"] = per_appliance.sum(axis=1)
+    out["cost_rs"] = out["kwh"] * tariff
+    out["co2_kg"] = out["kwh"] * emission_factor
+    for m in LOGGED:
+        out[f"logged_{m}"] = totals[f"{m}_sum"]
+        out[f"{m}_change"] = out[m] - out[f"logged_{m}"]
+    return out
+
+
+def appliance_means(totals, wattages=None):
+    """Mean kWh per logged row of each appliance (a Series indexed by name)."""
+    rows = totals["rows_count"].sum()
+    usage = totals[[f"{c}_sum" for c in USAGE_COLUMNS]].to_numpy(dtype=float).sum(axis=0)
+    means = usage * kwh_per_unit(wattages) / rows if rows else np.full(len(APPLIANCES), np.nan)
+    return pd.Series(means, index=[a.name for a in APPLIANCES])
+
+
+class UsageTotals:
+    """usage_totals() of the whole log, merged with each batch of new rows
+    (and with the removed rows subtracted)."""
+
+    def __init__(self, df):
+        self.table = usage_totals(df)
+
+    def update(self, new_rows, df, removed):
+        table = merge(self.table, usage_totals(new_rows))
+        if not removed.empty:
+            # Sums can be taken back: subtract the removed rows
+            table = table.sub(usage_totals(removed), fill_value=0)
+            table = table[table["rows_count"] > 0]
+        self.table = table
+
+    def by(self, level):
+        """Totals rolled up to ``"user_id"``, ``"period"`` or both (``None``)."""
+        return self.table if level is None else self.table.groupby(level=level).sum()
+
+
+register_view("usage_totals", UsageTotals)
+
+
+def get_usage_totals():
+    """The shared, up-to-date UsageTotals for the current log."""
+    return get_view("usage_totals")